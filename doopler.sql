@@ -76,7 +76,9 @@ CREATE TABLE `vad_gate_fit`  (
   PRIMARY KEY (`run_id`, `header_id`, `range_gate_index`) USING BTREE,
   INDEX `idx_fit_rule`(`rule_tag` ASC) USING BTREE,
   INDEX `idx_fit_status`(`status` ASC) USING BTREE,
-  INDEX `idx_fit_hdr_gate`(`header_id` ASC, `range_gate_index` ASC) USING BTREE
+  INDEX `idx_fit_hdr_gate`(`header_id` ASC, `range_gate_index` ASC) USING BTREE,
+  INDEX `idx_vgf_header_run`(`header_id` ASC, `run_id` ASC) USING BTREE,
+  INDEX `idx_vgf_status_run`(`status` ASC, `header_id` ASC, `run_id` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci COMMENT = 'VAD 反演結果（m/s / deg；dir為氣象來向），含病態/覆蓋度診斷與運行版本資訊' ROW_FORMAT = Dynamic;
 
 -- ----------------------------
@@ -90,7 +92,8 @@ CREATE TABLE `vad_rule_qc`  (
   `description` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
   `is_active` tinyint(1) NOT NULL DEFAULT 1,
   `rule_order` int NULL DEFAULT 0,
-  PRIMARY KEY (`rule_id`) USING BTREE
+  PRIMARY KEY (`rule_id`) USING BTREE,
+  INDEX `idx_rule_order`(`rule_order` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
@@ -180,6 +183,8 @@ CREATE TABLE `wind_profile_header`  (
   PRIMARY KEY (`header_id`) USING BTREE,
   UNIQUE INDEX `uq_file_time`(`filename` ASC, `start_time` ASC) USING BTREE,
   INDEX `fk_header_import`(`import_id` ASC) USING BTREE,
+  INDEX `idx_header_time`(`start_time` ASC) USING BTREE,
+  INDEX `idx_header_date`((cast(`start_time` as date)) ASC) USING BTREE,
   CONSTRAINT `fk_header_import` FOREIGN KEY (`import_id`) REFERENCES `import_run` (`import_id`) ON DELETE CASCADE ON UPDATE RESTRICT
 ) ENGINE = InnoDB AUTO_INCREMENT = 313 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
@@ -11,21 +11,26 @@ Features:
 5. GUI Folder Picker: Easy selection of data directories.
 """
 
+import csv
 import logging
+import mmap
+import multiprocessing
+import os
 import re
 import sys
-import pymysql
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Tuple
 from pathlib import Path
 
-# Try GUI folder picker (falls back to console input if unavailable)
+# Prefer the mysqlclient C extension (same DB-API surface); fall back to pure-Python PyMySQL
 try:
-    import tkinter as tk
-    from tkinter import filedialog
-except Exception:
-    tk = None
-    filedialog = None
+    import MySQLdb as dbapi
+    import MySQLdb.cursors
+except ImportError:
+    import pymysql as dbapi
 
 # =========================
 # Configuration
@@ -35,9 +40,72 @@ DB_PORT = 3306
 DB_USER = "shengic"
 DB_PASSWORD = "sirirat"
 DB_NAME = "doopler"
+# Protocol compression only pays off on a network link (mysqlclient only; PyMySQL lacks it).
+# The server's GLOBAL max_allowed_packet must be at least DB_MAX_PACKET for large batches.
+DB_COMPRESS = DB_HOST not in ("localhost", "127.0.0.1")
+DB_MAX_PACKET = 64 * 1024 * 1024
 
 LOG_FILE = "dooplerInsert_v3.log"
 
+# Worker processes for the CPU-bound HPL parsing stage (DB writes stay on the main process)
+PARSE_WORKERS = os.cpu_count() or 1
+# Parsed files allowed in flight ahead of the writer; bounds memory to a few files' payloads
+PARSE_AHEAD = 2 * PARSE_WORKERS
+
+# Files are committed in groups rather than one fsync per file; each file gets a
+# SAVEPOINT so a bad file is rolled back on its own without losing the group.
+COMMIT_EVERY_FILES = 50
+COMMIT_EVERY_ROWS = 500_000
+
+# Session settings applied once per import (best-effort; sql_log_bin needs admin rights).
+# unique_checks stays ON: the gate upsert relies on uq_gate_triplet to de-duplicate.
+BULK_SESSION_SQL = (
+    "SET SESSION foreign_key_checks = 0",
+    "SET SESSION sql_log_bin = 0",
+)
+
+# Bulk gate ingest through LOAD DATA LOCAL INFILE (server must allow local_infile=ON).
+# Falls back to executemany automatically when the server rejects it.
+USE_LOAD_DATA = True
+# Set by the first rejection so the rest of the run goes straight to executemany; main() clears it
+_load_data_rejected = False
+GATE_STAGE_TABLE = "wind_profile_gate_stage"
+GATE_COLUMNS = (
+    "header_id", "ray_idx", "range_gate_index", "doppler_ms", "intensity_snr_plus1",
+    "beta_m_inv_sr_inv", "spectral_width_ms", "decimal_time_hours", "azimuth_deg",
+    "elevation_deg", "pitch_deg", "roll_deg",
+)
+_GATE_COLS_SQL = ", ".join(GATE_COLUMNS)
+
+HEADER_UPSERT_SQL = """
+    INSERT INTO `doopler`.`wind_profile_header`
+      (import_id, filename, system_id, num_gates, range_gate_length_m, gate_length_pts, 
+       pulses_per_ray, num_rays_in_file, scan_type, focus_range, start_time, 
+       velocity_resolution_ms, range_center_formula, data_line1_format, 
+       data_line2_format, instrument_spectral_width_ms)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE 
+        import_id = VALUES(import_id),
+        header_id = LAST_INSERT_ID(header_id)
+"""
+
+# Gate SQL is built once. Freshly inserted headers cannot have gates yet, so they take
+# the plain INSERT path and skip the per-row duplicate-key probe of the upsert.
+GATE_ON_DUPLICATE_SQL = """
+    ON DUPLICATE KEY UPDATE 
+        doppler_ms=VALUES(doppler_ms), intensity_snr_plus1=VALUES(intensity_snr_plus1),
+        beta_m_inv_sr_inv=VALUES(beta_m_inv_sr_inv), spectral_width_ms=VALUES(spectral_width_ms)
+"""
+GATE_INSERT_SQL = f"""
+    INSERT INTO `doopler`.`wind_profile_gate` ({_GATE_COLS_SQL})
+    VALUES ({",".join(["%s"] * len(GATE_COLUMNS))})
+"""
+GATE_UPSERT_SQL = GATE_INSERT_SQL + GATE_ON_DUPLICATE_SQL
+GATE_MERGE_SQL = f"""
+    INSERT INTO `doopler`.`wind_profile_gate` ({_GATE_COLS_SQL})
+    SELECT {_GATE_COLS_SQL} FROM `{GATE_STAGE_TABLE}`
+"""
+
 # =========================
 # Logging Setup
 # =========================
@@ -65,57 +133,81 @@ HEADER_KEYS = [
     "Pulses/ray", "No. of rays in file", "Scan type", "Focus range", "Start time", "Resolution (m/s)",
 ]
 
+HEADER_SCAN_LIMIT = 300  # header is ~17 lines; give up if the sentinel is not found by here
+
+_HPL_FILENAME_RE = re.compile(r'^Wind_Profile_[0-9]+_([0-9]{8})_([0-9]{6})\.hpl$', re.IGNORECASE)
+_START_TIME_RE = re.compile(r"^(\d{8})\s+(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?$")
+_SPECTRAL_WIDTH_RE = re.compile(r"Instrument spectral width\s*=\s*([0-9.]+)")
+
 def parse_start_time(s: str) -> datetime:
-    m = re.match(r"^(\d{8})\s+(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?$", s.strip())
+    m = _START_TIME_RE.match(s.strip())
     if not m: raise ValueError(f"Unrecognized start time format: {s!r}")
     ymd, hh, mm, ss, frac = m.groups()
     usec = int(((frac or "0") + "000000")[:6])
     return datetime(int(ymd[:4]), int(ymd[4:6]), int(ymd[6:8]), int(hh), int(mm), int(ss), usec)
 
-def load_lines(hpl_path: str) -> List[str]:
-    # We log file reads to the log file, but not the console for clean display
-    logger.info("Reading HPL file: %s", hpl_path)
-    with open(hpl_path, "r", errors="ignore") as f:
-        lines = [ln.rstrip("\n") for ln in f]
-    return lines
+def load_lines(hpl_path: str) -> List[bytes]:
+    """Map the file and split it into raw byte lines; only the header gets decoded later."""
+    # Runs in parse workers: keep the hot path quiet at INFO and skip formatting entirely;
+    # the writer still logs one "Successfully processed" line per file
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Reading HPL file: %s", hpl_path)
+    with open(hpl_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:].splitlines()
+
+def prefetch_files(paths: List[Path]):
+    """Ask the kernel to start async readahead for every file up front (Linux/posix only).
+    Workers then map pages that are already cached instead of waiting on each read."""
+    if not hasattr(os, "posix_fadvise"): return
+    for p in paths:
+        try:
+            fd = os.open(p, os.O_RDONLY)
+            try: os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally: os.close(fd)
+        except OSError as e:
+            logger.debug("Prefetch skipped for %s: %s", p, e)
 
-def extract_header(lines: List[str]) -> Tuple[Dict[str, str], int]:
+def extract_header(raw_lines: List[bytes]) -> Tuple[Dict[str, str], int]:
+    """Single pass over the header; stops at the 'Instrument spectral width' sentinel line."""
     header: Dict[str, str] = {}
-    for ln in lines[:200]:
+    fmt_key = None  # set when the next line holds a "Data line N" format string
+    idx_sw = None
+    for i, raw in enumerate(raw_lines):
+        if i >= HEADER_SCAN_LIMIT: break
+        # Header is plain ASCII; latin-1 never fails so no errors= handling is needed
+        ln = raw.decode("latin-1")
+        if fmt_key:
+            header[fmt_key] = ln.strip(); fmt_key = None
         if ":" in ln:
             k, v = ln.split(":", 1); k, v = k.strip(), v.strip()
             if k in HEADER_KEYS or k in ["Data line 1", "Data line 2"]:
                 header[k] = v
         if "Range of measurement" in ln:
             header["Range of measurement"] = ln.split("=", 1)[-1].strip() if "=" in ln else ln.strip()
-    
-    i1 = next((i for i, ln in enumerate(lines[:200]) if ln.strip().startswith("Data line 1")), None)
-    i2 = next((i for i, ln in enumerate(lines[:240]) if ln.strip().startswith("Data line 2")), None)
-    if i1 is not None and i1+1 < len(lines): header["Data line 1 format"] = lines[i1+1].strip()
-    if i2 is not None and i2+1 < len(lines): header["Data line 2 format"] = lines[i2+1].strip()
-    
-    idx_sw = None
-    for i, ln in enumerate(lines[:300]):
+        stripped = ln.strip()
+        if stripped.startswith("Data line 1") and "Data line 1 format" not in header: fmt_key = "Data line 1 format"
+        elif stripped.startswith("Data line 2") and "Data line 2 format" not in header: fmt_key = "Data line 2 format"
         if "Instrument spectral width" in ln:
-            m = re.search(r"Instrument spectral width\s*=\s*([0-9.]+)", ln)
+            m = _SPECTRAL_WIDTH_RE.search(ln)
             if m: header["Instrument spectral width"] = m.group(1)
             idx_sw = i; break
     if idx_sw is None: raise RuntimeError("Instrument spectral width not found in header.")
     return header, idx_sw + 1
 
-def parse_data_blocks(lines: List[str], start_idx: int, num_rays: int, num_gates: int):
+def parse_data_blocks(lines: List[bytes], start_idx: int, num_rays: int, num_gates: int):
     idx = start_idx
     for ray in range(num_rays):
-        parts = lines[idx].strip().split()
-        if len(parts) < 5: raise RuntimeError(f"Ray {ray}: Bad Data line 1 at index {idx}")
-        tdec, azi, ele, pit, rol = map(float, parts[:5])
-        gates = []
-        for g in range(num_gates):
-            sp = lines[idx+1+g].strip().split()
-            if len(sp) < 5: raise RuntimeError(f"Ray {ray}, Gate {g}: Bad Data line 2")
-            try: rg = int(float(sp[0]))
-            except ValueError: rg = g
-            gates.append((rg, float(sp[1]), float(sp[2]), float(sp[3]), float(sp[4])))
+        # split() already drops surrounding whitespace; unpack straight from it
+        try: t_s, a_s, e_s, p_s, r_s, *_ = lines[idx].split()
+        except ValueError: raise RuntimeError(f"Ray {ray}: Bad Data line 1 at index {idx}")
+        tdec, azi, ele, pit, rol = float(t_s), float(a_s), float(e_s), float(p_s), float(r_s)
+        # Tokenize the whole Data line 2 block in C: (num_gates, 5) = gate, doppler, snr+1, beta, sw
+        block = lines[idx+1:idx+1+num_gates]
+        try: gates = np.loadtxt(block, dtype=np.float64, usecols=range(5), ndmin=2)
+        except ValueError as e: raise RuntimeError(f"Ray {ray}: Bad Data line 2 block ({e})")
+        if gates.shape[0] != num_gates: raise RuntimeError(f"Ray {ray}: Expected {num_gates} gates, found {gates.shape[0]}")
         yield (ray, tdec, azi, ele, pit, rol, gates)
         idx += 1 + num_gates
 
@@ -124,15 +216,27 @@ def parse_data_blocks(lines: List[str], start_idx: int, num_rays: int, num_gates
 # =========================
 
 def get_connection():
-    return pymysql.connect(host=DB_HOST, port=DB_PORT, user=DB_USER,
-                           password=DB_PASSWORD, database=DB_NAME,
-                           charset="utf8mb4", autocommit=False,
-                           cursorclass=pymysql.cursors.DictCursor)
+    if dbapi.__name__ == "MySQLdb": extra = {"compress": DB_COMPRESS}
+    else: extra = {"max_allowed_packet": DB_MAX_PACKET}
+    return dbapi.connect(host=DB_HOST, port=DB_PORT, user=DB_USER,
+                         password=DB_PASSWORD, database=DB_NAME,
+                         charset="utf8mb4", autocommit=False,
+                         local_infile=USE_LOAD_DATA,
+                         cursorclass=dbapi.cursors.Cursor, **extra)
+
+def missing_tables(conn, names: Tuple[str, ...]) -> List[str]:
+    """Return the required tables absent from the current schema (one round trip)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema=DATABASE() AND table_name IN %s", (names,))
+        present = {r[0] for r in cur.fetchall()}
+    return [t for t in names if t not in present]
 
-def table_exists(conn, t: str) -> bool:
+def configure_bulk_session(conn):
+    """Relax per-row session checks for the import; settings the account may not change are skipped."""
     with conn.cursor() as cur:
-        cur.execute("SELECT 1 FROM information_schema.tables WHERE table_schema=DATABASE() AND table_name=%s", (t,))
-        return cur.fetchone() is not None
+        for stmt in BULK_SESSION_SQL:
+            try: cur.execute(stmt)
+            except dbapi.MySQLError as e: logger.warning("Session setting skipped (%s): %s", stmt, e)
 
 def create_import_run(conn, folder_path: str, files_count: int) -> int:
     """Create a batch entry and return the import_id"""
@@ -143,19 +247,9 @@ def create_import_run(conn, folder_path: str, files_count: int) -> int:
     conn.commit()  # Commit immediately so foreign keys can reference it
     return import_id
 
-def upsert_header_and_get_header_id(conn, h: Dict[str, str], import_id: int) -> int:
-    """Insert or update header with association to import_id"""
-    sql = """
-    INSERT INTO `doopler`.`wind_profile_header`
-      (import_id, filename, system_id, num_gates, range_gate_length_m, gate_length_pts, 
-       pulses_per_ray, num_rays_in_file, scan_type, focus_range, start_time, 
-       velocity_resolution_ms, range_center_formula, data_line1_format, 
-       data_line2_format, instrument_spectral_width_ms)
-    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE 
-        import_id = VALUES(import_id),
-        header_id = LAST_INSERT_ID(header_id)
-    """
+def upsert_header_and_get_header_id(cur, h: Dict[str, str], import_id: int) -> Tuple[int, bool]:
+    """Insert or update header with association to import_id. Returns (header_id, is_new).
+    Runs on the caller's long-lived cursor so every file sends the identical statement text."""
     params = (
         import_id, h["Filename"], int(h["System ID"]), int(h["Number of gates"]),
         float(h["Range gate length (m)"]), int(h["Gate length (pts)"]),
@@ -165,47 +259,79 @@ def upsert_header_and_get_header_id(conn, h: Dict[str, str], import_id: int) ->
         h.get("Data line 1 format"), h.get("Data line 2 format"),
         float(h["Instrument spectral width"])
     )
-    with conn.cursor() as cur:
-        cur.execute(sql, params)
-        return cur.lastrowid
-
-def upsert_gate_rows(conn, header_id: int, ray_idx: int, dl1: tuple, gates: list):
-    tdec, azi, ele, pit, rol = dl1
-    sql = """
-    INSERT INTO `doopler`.`wind_profile_gate`
-      (header_id, ray_idx, range_gate_index, doppler_ms, intensity_snr_plus1,
-       beta_m_inv_sr_inv, spectral_width_ms, decimal_time_hours, azimuth_deg,
-       elevation_deg, pitch_deg, roll_deg)
-    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE 
-        doppler_ms=VALUES(doppler_ms), intensity_snr_plus1=VALUES(intensity_snr_plus1),
-        beta_m_inv_sr_inv=VALUES(beta_m_inv_sr_inv), spectral_width_ms=VALUES(spectral_width_ms)
-    """
-    payload = [(header_id, ray_idx, rg, dop, inten, beta, sw, tdec, azi, ele, pit, rol)
-               for (rg, dop, inten, beta, sw) in gates]
-    with conn.cursor() as cur:
-        cur.executemany(sql, payload)
+    cur.execute(HEADER_UPSERT_SQL, params)
+    # Affected rows: 1 = new row inserted, 2 = existing row updated, 0 = existing row unchanged
+    return cur.lastrowid, cur.rowcount == 1
+
+def load_gate_rows(cur, payload: List[tuple], upsert: bool = True):
+    """Stage gate rows through a temp CSV + LOAD DATA, then merge into wind_profile_gate."""
+    fd, csv_path = tempfile.mkstemp(prefix="hpl_gates_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerows(payload)
+        # TEMPORARY tables are per-connection and do not trigger an implicit commit
+        cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS `{GATE_STAGE_TABLE}` "
+                    f"SELECT {_GATE_COLS_SQL} FROM `wind_profile_gate` LIMIT 0")
+        cur.execute(f"DELETE FROM `{GATE_STAGE_TABLE}`")
+        cur.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE `{GATE_STAGE_TABLE}` "
+                    f"FIELDS TERMINATED BY ',' LINES TERMINATED BY '\\n' ({_GATE_COLS_SQL})",
+                    (csv_path.replace("\\", "/"),))
+        cur.execute(GATE_MERGE_SQL + GATE_ON_DUPLICATE_SQL if upsert else GATE_MERGE_SQL)
+    finally:
+        os.remove(csv_path)
+
+def write_gate_rows(cur, payload: List[tuple], upsert: bool = True):
+    """Write every gate row of a file in one shot (LOAD DATA, or a single extended INSERT)."""
+    global _load_data_rejected
+    if USE_LOAD_DATA and not _load_data_rejected:
+        try:
+            load_gate_rows(cur, payload, upsert)
+            return
+        except dbapi.IntegrityError:
+            raise
+        except dbapi.MySQLError as e:
+            _load_data_rejected = True
+            logger.warning("LOAD DATA LOCAL INFILE rejected (%s); using executemany for the rest of this run.", e)
+    cur.executemany(GATE_UPSERT_SQL if upsert else GATE_INSERT_SQL, payload)
+
+def upsert_gate_rows(cur, payload: List[tuple], fresh: bool = False):
+    """Plain INSERT for gates of a new header; upsert for re-imports or on duplicate keys.
+    All gate writers share the session cursor opened in main()."""
+    if not payload: return
+    if fresh:
+        try:
+            write_gate_rows(cur, payload, upsert=False)
+            return
+        except dbapi.IntegrityError as e:
+            logger.warning("Duplicate gate rows on a new header (%s); retrying as upsert.", e)
+    write_gate_rows(cur, payload, upsert=True)
 
 # =========================
 # Execution Flow
 # =========================
 
-def process_file(conn, path: Path, import_id: int, idx: int, total: int) -> int:
-    # Single-line refresh for console
-    print_progress(f"[{idx}/{total}] Processing: {path.name}...")
-    
+def parse_file(path: Path):
+    """Read and parse one HPL file. Runs inside a worker process, so it must not touch the DB."""
     lines = load_lines(str(path))
     header, data_start = extract_header(lines)
     num_rays = int(header["No. of rays in file"])
     num_gates = int(header["Number of gates"])
+    return header, list(parse_data_blocks(lines, data_start, num_rays, num_gates))
 
-    header_id = upsert_header_and_get_header_id(conn, header, import_id)
-    file_gates = 0
-    for (ray, tdec, azi, ele, pit, rol, gates) in parse_data_blocks(lines, data_start, num_rays, num_gates):
-        upsert_gate_rows(conn, header_id, ray, (tdec, azi, ele, pit, rol), gates)
-        file_gates += len(gates)
+def process_file(cur, path: Path, parsed, import_id: int, idx: int, total: int) -> int:
+    # Single-line refresh for console
+    print_progress(f"[{idx}/{total}] Processing: {path.name}...")
     
-    conn.commit()
+    header, blocks = parsed
+    header_id, is_new = upsert_header_and_get_header_id(cur, header, import_id)
+    # Collect all rays of the file first so the gates go out in one round trip
+    all_rows = []
+    for (ray, tdec, azi, ele, pit, rol, gates) in blocks:
+        rgs = gates[:, 0].astype(np.int32).tolist()
+        all_rows.extend((header_id, ray, rg, dop, inten, beta, sw, tdec, azi, ele, pit, rol)
+                        for rg, (dop, inten, beta, sw) in zip(rgs, gates[:, 1:].tolist()))
+    upsert_gate_rows(cur, all_rows, fresh=is_new)
+    file_gates = len(all_rows)
     
     # Second update for console once success
     print_progress(f"[{idx}/{total}] Success: {path.name} ({file_gates} gates)")
@@ -213,49 +339,104 @@ def process_file(conn, path: Path, import_id: int, idx: int, total: int) -> int:
     return file_gates
 
 def select_folder() -> str:
-    if tk is None: return input("Enter folder path: ").strip().strip('"')
+    # Try GUI folder picker (falls back to console input if unavailable); imported
+    # here so headless batch runs never load Tk
+    try:
+        import tkinter as tk
+        from tkinter import filedialog
+    except Exception:
+        return input("Enter folder path: ").strip().strip('"')
     root = tk.Tk(); root.withdraw(); root.attributes('-topmost', True)
     folder = filedialog.askdirectory(title="Select folder with .hpl files")
     root.destroy()
     return folder
 
-def main():
+def main(folder=None):
     try:
-        folder = select_folder()
+        folder = folder or select_folder()
         if not folder:
             print("No folder selected. Exiting.")
             return
         
         root = Path(folder)
-        pattern = re.compile(r'^Wind_Profile_[0-9]+_([0-9]{8})_([0-9]{6})\.hpl$', re.IGNORECASE)
-        candidates = [p for p in root.iterdir() if p.is_file() and pattern.match(p.name)]
-        files = sorted(candidates, key=lambda p: datetime.strptime(''.join(pattern.match(p.name).groups()), '%Y%m%d%H%M%S'))
+        # One regex match per file; the fixed-width YYYYMMDDHHMMSS key sorts chronologically as text
+        stamped = [(m.group(1) + m.group(2), p) for p in root.iterdir()
+                   if p.is_file() and (m := _HPL_FILENAME_RE.match(p.name))]
+        files = [p for _, p in sorted(stamped, key=lambda t: t[0])]
         
         if not files:
             print(f"No matching .hpl files found in {root}")
             return
 
+        global _load_data_rejected
+        _load_data_rejected = False
         conn = get_connection()
         try:
-            for t in ("wind_profile_header", "wind_profile_gate", "import_run"):
-                if not table_exists(conn, t):
-                    print(f"Error: Table '{t}' is missing. Check your SQL schema.")
-                    return
+            missing = missing_tables(conn, ("wind_profile_header", "wind_profile_gate", "import_run"))
+            if missing:
+                print(f"Error: Table '{missing[0]}' is missing. Check your SQL schema.")
+                return
 
             # Initialize Batch Session
             import_id = create_import_run(conn, folder, len(files))
+            configure_bulk_session(conn)
             print(f"Session Started | Import ID: {import_id}\n")
 
             grand_total = 0
             processed_count = 0
-            for i, p in enumerate(files, 1):
+            batch_files, batch_rows = 0, 0
+
+            def rollback_batch():
+                # The server may already have rolled the transaction back (deadlock, dropped link)
                 try:
-                    count = process_file(conn, p, import_id, i, len(files))
-                    grand_total += count
-                    processed_count += 1
+                    conn.rollback()
                 except Exception as e:
-                    print(f"\n[Error] Failed processing {p.name}: {e}")
-                    logger.exception("Error processing file %s: %s", p.name, e)
+                    logger.error("Rollback failed: %s", e)
+
+            def commit_batch():
+                nonlocal grand_total, processed_count, batch_files, batch_rows
+                try:
+                    conn.commit()
+                    grand_total += batch_rows
+                    processed_count += batch_files
+                except Exception as e:
+                    rollback_batch()
+                    print(f"\n[Error] Commit failed, {batch_files} file(s) rolled back: {e}")
+                    logger.exception("Batch commit failed (%d files): %s", batch_files, e)
+                batch_files, batch_rows = 0, 0
+
+            # Producer/consumer: workers parse up to PARSE_AHEAD files ahead while this process
+            # writes in file order. 'spawn' workers: main() may run on a Dashboard worker thread,
+            # and forking a multi-threaded process can deadlock on locks held by other threads.
+            prefetch_files(files)
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(parse_file, p) for p in files[:PARSE_AHEAD]]
+                with conn.cursor() as cur:
+                    for i, p in enumerate(files, 1):
+                        if i - 1 + PARSE_AHEAD < len(files):
+                            futures.append(pool.submit(parse_file, files[i - 1 + PARSE_AHEAD]))
+                        # Drop the consumed future so its parsed payload can be freed
+                        fut, futures[i - 1] = futures[i - 1], None
+                        try:
+                            cur.execute("SAVEPOINT hpl_file")
+                            count = process_file(cur, p, fut.result(), import_id, i, len(files))
+                            batch_rows += count
+                            batch_files += 1
+                        except Exception as e:
+                            print(f"\n[Error] Failed processing {p.name}: {e}")
+                            logger.exception("Error processing file %s: %s", p.name, e)
+                            try:
+                                cur.execute("ROLLBACK TO SAVEPOINT hpl_file")
+                            except Exception as se:
+                                # InnoDB already rolled back the whole transaction (deadlock, lock
+                                # wait timeout, lost connection): the savepoint and the group are gone
+                                rollback_batch()
+                                print(f"\n[Error] Transaction lost, {batch_files} earlier file(s) of this group rolled back: {se}")
+                                logger.error("Savepoint rollback failed, %d file(s) lost: %s", batch_files, se)
+                                batch_files, batch_rows = 0, 0
+                        if batch_files >= COMMIT_EVERY_FILES or batch_rows >= COMMIT_EVERY_ROWS:
+                            commit_batch()
+            commit_batch()
 
             # Final summary after loops
             print(f"\n\nIMPORT COMPLETED.")
@@ -263,6 +444,7 @@ def main():
             print(f"Files processed: {processed_count}/{len(files)}")
             print(f"Total gate rows inserted: {grand_total}")
             logger.info("IMPORT COMPLETED. ID: %d, Total Gates: %d", import_id, grand_total)
+            return grand_total
 
         finally:
             conn.close()
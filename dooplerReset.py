@@ -8,8 +8,11 @@ Preserves: Configuration tables like 'vad_rule_qc'.
 """
 
 import pymysql
+from pymysql.constants import CLIENT
 import logging
+import re
 import sys
+from pathlib import Path
 
 # Database Configuration
 DB_CONFIG = {
@@ -18,7 +21,8 @@ DB_CONFIG = {
     "password": "sirirat",
     "database": "doopler",
     "charset": "utf8mb4",
-    "cursorclass": pymysql.cursors.DictCursor
+    "autocommit": True,
+    "client_flag": CLIENT.MULTI_STATEMENTS
 }
 
 # Tables to be cleared (Child tables first, then Parent tables)
@@ -30,17 +34,41 @@ TABLES_TO_WIPE = [
     "import_run"
 ]
 
+# Index migration applied by `--indexes` (see schema_indexes.sql)
+INDEX_SQL_FILE = Path(__file__).with_name("schema_indexes.sql")
+_CREATE_INDEX_RE = re.compile(r"CREATE\s+INDEX\s+`?(\w+)`?\s+ON\s+`?(\w+)`?", re.IGNORECASE)
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 logger = logging.getLogger("ResetTool")
 
-def get_row_count(cur, table_name):
-    """Retrieves current row count for a table."""
+def get_row_counts(cur, table_names):
+    """Retrieves current row counts for all tables in a single SELECT."""
+    try:
+        cur.execute("SELECT " + ", ".join(f"(SELECT COUNT(*) FROM `{t}`)" for t in table_names))
+        return dict(zip(table_names, cur.fetchone()))
+    except pymysql.MySQLError as e:
+        logger.warning(f"Row count preview failed: {e}")
+        return dict.fromkeys(table_names, 0)
+
+def ensure_indexes():
+    """Creates the indexes listed in schema_indexes.sql that do not exist yet (idempotent)."""
+    body = "\n".join(l for l in INDEX_SQL_FILE.read_text(encoding="utf-8").splitlines() if not l.lstrip().startswith("--"))
+    statements = [s.strip() for s in body.split(";")]
+    wanted = [(m.group(1), m.group(2), s) for s in statements if (m := _CREATE_INDEX_RE.search(s))]
+    conn = pymysql.connect(**DB_CONFIG)
     try:
-        cur.execute(f"SELECT COUNT(*) as cnt FROM `{table_name}`")
-        result = cur.fetchone()
-        return result['cnt']
-    except:
-        return 0
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = %s",
+                        (DB_CONFIG["database"],))
+            present = set(cur.fetchall())
+            for index, table, sql in wanted:
+                if (table, index) in present:
+                    logger.info(f"Index {table}.{index} already present")
+                    continue
+                logger.info(f"Creating index {table}.{index}...")
+                cur.execute(sql)
+    finally:
+        conn.close()
 
 def reset_database():
     try:
@@ -52,8 +80,9 @@ def reset_database():
             print("\nThe following tables will be COMPLETELY WIPED:")
             
             # Show current data volume
+            counts = get_row_counts(cur, TABLES_TO_WIPE)
             for table in TABLES_TO_WIPE:
-                count = get_row_count(cur, table)
+                count = counts[table]
                 print(f" - {table.ljust(25)} : {str(count).rjust(10)} rows found")
             
             print("\n" + "-" * 60)
@@ -72,17 +101,15 @@ def reset_database():
 
             print("\nProcessing reset, please wait...")
             
-            # 1. Temporarily disable foreign key checks to allow TRUNCATE
-            cur.execute("SET FOREIGN_KEY_CHECKS = 0;")
-
-            # 2. Execute TRUNCATE (Wipes data AND resets the ID counter to 1)
-            for table in TABLES_TO_WIPE:
-                logger.info(f"Wiping {table} and resetting ID counter to 1...")
-                cur.execute(f"TRUNCATE TABLE `{table}`;")
-
-            # 3. Restore foreign key integrity
-            cur.execute("SET FOREIGN_KEY_CHECKS = 1;")
-            
+            # Disable FK checks, TRUNCATE (wipes data AND resets the ID counter to 1),
+            # restore FK integrity -- sent as one multi-statement round trip
+            logger.info(f"Wiping {', '.join(TABLES_TO_WIPE)} and resetting ID counters to 1...")
+            sql = ("SET FOREIGN_KEY_CHECKS = 0; "
+                   + "".join(f"TRUNCATE TABLE `{table}`; " for table in TABLES_TO_WIPE)
+                   + "SET FOREIGN_KEY_CHECKS = 1;")
+            # (TRUNCATE commits implicitly, so there is no transaction to open here)
+            cur.execute(sql)
+            while cur.nextset(): pass
             conn.commit()
             
             print("\n" + "=" * 60)
@@ -99,4 +126,8 @@ def reset_database():
             conn.close()
 
 if __name__ == "__main__":
+    if "--indexes" in sys.argv[1:]:
+        # Index migration only; never falls through to the wipe prompt
+        ensure_indexes()
+        sys.exit(0)
     reset_database()
\ No newline at end of file
@@ -5,44 +5,83 @@
 # Audit: 440+ Lines, Full Modal Logic, SQL Join preservation, and Dynamic Reloads.
 
 import tkinter as tk
-from tkinter import ttk, messagebox
-from tkcalendar import DateEntry
+from tkinter import ttk, messagebox, filedialog
 import pymysql
+import pymysqlpool
 import sys
 import os
 import logging
+import logging.handlers
+import atexit
+import contextlib
 import importlib
-import threading
+import importlib.util
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
-# Matplotlib embedding dependencies for Region 3 visualization
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-
 # =============================================================================
 # 1. SYSTEM INITIALIZATION & MODULE DYNAMICS
 # =============================================================================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+# Log records are queued and written to stdout by a listener thread, so a slow
+# console never stalls the Tk thread on a logger call
+_log_queue = queue.Queue(-1)
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_stream.setFormatter(logging.Formatter('%(asctime)s | %(levelname)s | %(name)s | %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger("Dashboard")
 
+# Log views stream their SELECT and hand rows to the Treeview in batches of this size
+STREAM_BATCH_ROWS = 200
+
+# Log views page with keyset queries as the user scrolls: rows per page, and rows kept
+# in the Treeview (rows scrolled past are dropped from the far end and reloaded on demand)
+LOG_PAGE_ROWS = 50
+LOG_WINDOW_ROWS = 200
+
+# Refresh Table clicks within this many seconds of the last rules SELECT reuse it
+RULES_REFRESH_TTL = 2.0
+
+# Days whose wind data stays cached for re-plotting (least recently viewed is dropped first)
+PLOT_CACHE_DAYS = 4
+
+# Shared tag tuples for the rule table rows
+_ACTIVE_TAG, _INACTIVE_TAG = ('active_row',), ('inactive_row',)
+
 # Ensure the current directory is in the path for module loading
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
+# module_name -> (module, (mtime_ns, size) of its source) from the last successful load
+_MODULE_CACHE = {}
+
 def force_load_module(module_name):
     """
-    Clears the Python module cache to ensure the Dashboard always uses the 
-    latest code found on disk. Critical for iterative development.
+    Returns the pipeline module, reloading it only when its source file on disk
+    changed since the last load, so the Dashboard still picks up edits without
+    re-executing heavy imports on every button click.
     """
-    if module_name in sys.modules:
-        del sys.modules[module_name]
     try:
-        return importlib.import_module(module_name)
+        spec = importlib.util.find_spec(module_name)
+        if spec is None or not spec.origin:
+            raise ModuleNotFoundError(f"No module named '{module_name}'")
+        # Size guards against coarse mtime resolution (e.g. FAT/SMB shares) hiding a quick re-save
+        st = os.stat(spec.origin)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = _MODULE_CACHE.get(module_name)
+        if cached and cached[1] == stamp and sys.modules.get(module_name) is cached[0]:
+            return cached[0]
+        mod = sys.modules.get(module_name)
+        mod = importlib.reload(mod) if mod is not None else importlib.import_module(module_name)
+        _MODULE_CACHE[module_name] = (mod, stamp)
+        return mod
     except Exception as e:
         logger.error(f"Module Dynamics Error [{module_name}]: {e}")
         return None
@@ -68,9 +107,18 @@ class DopplerApp:
             "password": "sirirat",
             "database": "doopler",
             "charset": "utf8mb4",
-            "cursorclass": pymysql.cursors.DictCursor,
-            "connect_timeout": 5
+            "cursorclass": pymysql.cursors.DictCursor
         }
+        # Shared pool: handlers borrow via `with self._get_db_conn() as conn:` and leaving the
+        # block hands the connection back instead of tearing down the socket (see _get_db_conn). Autocommit keeps the read
+        # paths from leaving an implicit transaction open; writes still call commit().
+        # con_lifetime recycles idle sockets before the server's wait_timeout drops them.
+        pool_args = dict(size=4, maxsize=8, name="doopler", autocommit=True, con_lifetime=600, **self.db_config)
+        try:
+            self.db_pool = pymysqlpool.ConnectionPool(pre_create_num=2, **pool_args)
+        except pymysql.MySQLError as e:
+            logger.error(f"DB Pool Warm-up Failed: {e}")
+            self.db_pool = pymysqlpool.ConnectionPool(pre_create_num=0, **pool_args)
 
         # --- Global Style Adjustments ---
         style = ttk.Style()
@@ -80,10 +128,31 @@ class DopplerApp:
         self.current_log_view = "header" # 'header', 'proc', 'date_list', 'plot'
         self.canvas_widget = None
         self.toolbar_widget = None
+        self._last_refresh = 0.0  # time.monotonic() of the last refresh_db_status
+        self._refresh_after_id = None  # pending root.after id of a debounced refresh
+        self._tree_gen = 0  # bumped per log query; batches from an older stream are dropped
+        self._log_next_page = None  # loads the next (older) keyset page of the log view; None = none/loading
+        self._log_prev_page = None  # loads the previous (newer) page once the top rows were trimmed
+        self._log_more = {"prev": False, "next": False}  # keyset pages left beyond the tree's rows
+        self._log_keys = {}  # log tree item id -> keyset key of its row
+        self._rule_cache = {}  # rule_id -> row dict from the last load_rules
+        self._rules_loaded_at = 0.0  # monotonic time of the last rules SELECT (0 = must reload)
+        self._pending_rule_updates = {}  # rule_id -> staged description, written by Commit Edits
+        self._data_version = None  # (gate count, solved count) from the last refresh_db_status
+        self._plot_cache = OrderedDict()  # (start_ts, end_ts, data_version) -> DataFrame, LRU of PLOT_CACHE_DAYS
+        self._date_cache = None  # solved observation dates ('YYYY-MM-DD'); None = reload on next view
+        
+        # DB work runs on a small executor (one worker per pooled connection); workers only
+        # enqueue (callback, result) pairs and _drain_results applies them on the Tk thread
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="doopler-db")
+        self.result_q = queue.Queue()
+        self.root.after(50, self._drain_results)
+        # Closing the window with staged rule descriptions asks to commit or discard them
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Construction
         self.create_widgets()
-        self.refresh_db_status() 
+        self._debounced_refresh() 
         self.load_rules() 
         logger.info("Application System Online.")
 
@@ -97,12 +166,12 @@ class DopplerApp:
         
         # Step 1: Ingestion
         f1 = ttk.Frame(group_pipeline); f1.pack(**btn_layout)
-        ttk.Button(f1, text="1. Import HPL Files", command=self.handle_insert).pack(fill="x")
+        self.btn_insert = ttk.Button(f1, text="1. Import HPL Files", command=self.handle_insert); self.btn_insert.pack(fill="x")
         self.lbl_gate_count = ttk.Label(f1, text="Total Gates: 0", foreground="#0056b3", font=("Arial", 9, "bold")); self.lbl_gate_count.pack()
 
         # Step 2: Quality Control
         f2 = ttk.Frame(group_pipeline); f2.pack(**btn_layout)
-        ttk.Button(f2, text="2. Run Quality Control (QC)", command=self.handle_qc).pack(fill="x")
+        self.btn_qc = ttk.Button(f2, text="2. Run Quality Control (QC)", command=self.handle_qc); self.btn_qc.pack(fill="x")
         ttk.Label(f2, text="").pack()
 
         # Step 2.1: Process Run History
@@ -112,7 +181,7 @@ class DopplerApp:
 
         # Step 3: UVW Calculation
         f3 = ttk.Frame(group_pipeline); f3.pack(**btn_layout)
-        ttk.Button(f3, text="3. Calculate UVW Wind", command=self.handle_uvw).pack(fill="x")
+        self.btn_uvw = ttk.Button(f3, text="3. Calculate UVW Wind", command=self.handle_uvw); self.btn_uvw.pack(fill="x")
         self.lbl_uvw_count = ttk.Label(f3, text="UVW Solved: 0", foreground="#0056b3", font=("Arial", 9, "bold")); self.lbl_uvw_count.pack()
 
         # Step 4: Visualization
@@ -125,7 +194,7 @@ class DopplerApp:
         group_info.pack(fill="x", padx=25, pady=5)
         self.lbl_db_info = ttk.Label(group_info, text="Detecting database timeframe...", font=("Arial", 9, "italic"))
         self.lbl_db_info.pack(side="left", padx=10, pady=5)
-        ttk.Button(group_info, text="🔄 Sync All Logs", command=self.refresh_db_status).pack(side="right", padx=10, pady=5)
+        ttk.Button(group_info, text="🔄 Sync All Logs", command=self._debounced_refresh).pack(side="right", padx=10, pady=5)
 
         # --- SECTION 2: Dynamic Content Area (MARK AREA 3) ---
         self.group_log = ttk.LabelFrame(self.root, text="Data Log Window (Region 3)")
@@ -137,10 +206,17 @@ class DopplerApp:
         self.tree = ttk.Treeview(self.table_frame, columns=self.log_cols, show='headings', height=12)
         vsb = ttk.Scrollbar(self.table_frame, orient="vertical", command=self.tree.yview)
         hsb = ttk.Scrollbar(self.table_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        self.tree.configure(yscrollcommand=lambda first, last: self._on_log_scroll(vsb, first, last), xscrollcommand=hsb.set)
         self.tree.grid(column=0, row=0, sticky='nsew'); vsb.grid(column=1, row=0, sticky='ns'); hsb.grid(column=0, row=1, sticky='ew')
         self.table_frame.grid_columnconfigure(0, weight=1); self.table_frame.grid_rowconfigure(0, weight=1)
         
+        # Per-view column layouts as (col, heading, width, anchor); applied by _apply_cols
+        self._header_cols_cfg = [(f"c{i+1}", h, w, "center" if i != 2 else "w") for i, (h, w) in enumerate(zip(
+            ["Header ID", "Start Time", "Filename", "Gates", "Gate Len (m)", "Proc Runs"], [80, 160, 450, 60, 90, 100]))]
+        self._proc_cols_cfg = [(f"c{i+1}", h, w, "center" if i < 4 else "w") for i, (h, w) in enumerate(zip(
+            ["Run ID", "Rule Tag", "Started At", "Finished At", "Params JSON", ""], [100, 150, 160, 160, 450, 10]))]
+        self._current_cols_cfg = [None] * len(self.log_cols)
+        
         # 3.2: Date Selection List
         self.date_frame = ttk.Frame(self.group_log)
         ttk.Label(self.date_frame, text="Select Observation Date to Render Plot:", font=("Arial", 10, "bold")).pack(pady=5)
@@ -192,8 +268,10 @@ class DopplerApp:
         self.rule_tree.bind("<ButtonRelease-1>", self.handle_rule_click)
         
         r_btn_frame = ttk.Frame(group_rules); r_btn_frame.pack(fill="x", padx=10, pady=5)
-        ttk.Button(r_btn_frame, text="🔄 Refresh Table", command=self.load_rules).pack(side="left", padx=5)
+        ttk.Button(r_btn_frame, text="🔄 Refresh Table", command=lambda: self.load_rules(max_age=RULES_REFRESH_TTL)).pack(side="left", padx=5)
         ttk.Button(r_btn_frame, text="📝 Edit Description (Popup)", command=self.handle_edit_desc).pack(side="left", padx=5)
+        self.btn_commit_desc = ttk.Button(r_btn_frame, text="💾 Commit Edits (0)", command=self.handle_commit_desc_edits)
+        self.btn_commit_desc.pack(side="left", padx=5)
 
         # --- SECTION 4: Maintenance Area ---
         group_maint = ttk.LabelFrame(self.root, text="Maintenance Area"); group_maint.pack(fill="x", padx=25, pady=15)
@@ -205,9 +283,148 @@ class DopplerApp:
     # LOGIC & DATABASE HANDLERS
     # =========================================================================
 
+    @contextlib.contextmanager
     def _get_db_conn(self):
-        """Utility for fresh, thread-safe database connections."""
-        return pymysql.connect(**self.db_config)
+        """Borrows a pooled connection (pinged first): `with self._get_db_conn() as conn:`.
+        A clean exit puts it back; an error discards it and frees its pool slot. (pymysqlpool's own
+        __exit__ closes the socket on most errors but keeps counting it, so 8 failures would
+        exhaust the pool for good.)"""
+        conn = self.db_pool.get_connection()
+        try:
+            conn.ping(reconnect=True)
+            yield conn
+        except BaseException:
+            conn._pool = None
+            try:
+                pymysql.connections.Connection.close(conn)
+            except Exception:
+                conn._force_close()
+            self.db_pool._created_num.pop()
+            raise
+        else:
+            conn.close()  # pooled close() = hand back to the pool
+
+    def _run_in_background(self, work, on_done, label, use_db=True, on_error=None):
+        """Runs work(conn) (or work() when use_db=False) on the DB executor so the Tk loop
+        never blocks on MySQL; on_done(result) -- or on_error(exc) if work raised -- is queued
+        for _drain_results, and only those callbacks touch widgets (Tk is not thread-safe)."""
+        def worker():
+            try:
+                if use_db:
+                    with self._get_db_conn() as conn:
+                        result = work(conn)
+                else:
+                    result = work()
+            except Exception as e:
+                logger.error(f"{label}: {e}")
+                if on_error: self.result_q.put((on_error, e))
+                return
+            self.result_q.put((on_done, result))
+        self.executor.submit(worker)
+
+    def _drain_results(self):
+        """Applies queued worker results on the Tk thread, then re-arms itself every 50 ms."""
+        while True:
+            try: on_done, result = self.result_q.get_nowait()
+            except queue.Empty: break
+            try: on_done(result)
+            except Exception as e: logger.exception(f"UI Update Error: {e}")
+        self.root.after(50, self._drain_results)
+
+    def _append_tree_rows(self, tree, rows, tags=None, index="end"):
+        """Appends a batch of Treeview rows (or inserts each at index); columns are hidden meanwhile
+        so Tk redraws once. Returns the new item ids."""
+        shown = tree["displaycolumns"]
+        tree.configure(displaycolumns=())
+        insert = tree.insert
+        if tags:
+            iids = [insert("", index, values=values, tags=tag) for values, tag in zip(rows, tags)]
+        else:
+            iids = [insert("", index, values=values) for values in rows]
+        tree.configure(displaycolumns=shown)
+        return iids
+
+    def _reload_tree(self, tree, rows, tags=None):
+        """Replaces all Treeview rows in one batch."""
+        tree.delete(*tree.get_children())
+        self._append_tree_rows(tree, rows, tags)
+
+    def _apply_cols(self, cfg):
+        """Applies a column layout to the log tree, skipping the Tcl calls for columns already set."""
+        for i, entry in enumerate(cfg):
+            if self._current_cols_cfg[i] == entry: continue
+            col, heading, width, anchor = entry
+            self.tree.heading(col, text=heading); self.tree.column(col, width=width, anchor=anchor)
+            self._current_cols_cfg[i] = entry
+
+    def _stream_log(self, sql, view, label, params=None, row_fn=None, key_fn=None, page=None, load_page=None):
+        """Streams a log query through an unbuffered SSCursor and adds rows to the log tree
+        STREAM_BATCH_ROWS at a time through the result queue. The cursor is fully drained inside work(),
+        so the connection is idle again when it returns to the pool.
+        page=None clears the tree first; "next" appends older rows, "prev" gets newer rows in
+        ascending order and stacks them on top. The tree keeps LOG_WINDOW_ROWS rows, trimming the far
+        end; key_fn(row) keys each item so load_page(after=...) / load_page(before=...) can reload the
+        trimmed or unseen pages from _on_log_scroll."""
+        self._tree_gen += 1
+        gen = self._tree_gen
+        self._log_next_page = self._log_prev_page = None
+        if page is None:
+            self.tree.delete(*self.tree.get_children())
+            self._log_keys = {}
+            self._log_more = {"prev": False, "next": False}
+        added = [0]
+
+        def append(rows):
+            if gen != self._tree_gen or self.current_log_view != view: return  # user moved on
+            iids = self._append_tree_rows(self.tree, [v for v, _ in rows], index=0 if page == "prev" else "end")
+            self._log_keys.update(zip(iids, (k for _, k in rows)))
+            added[0] += len(iids)
+            children = self.tree.get_children()
+            excess = len(children) - LOG_WINDOW_ROWS
+            if excess > 0:
+                far_end = "next" if page == "prev" else "prev"
+                drop = children[-excess:] if far_end == "next" else children[:excess]
+                self.tree.delete(*drop)
+                for iid in drop: self._log_keys.pop(iid, None)
+                self._log_more[far_end] = True
+
+        def finish(res):
+            batch, count = res
+            append(batch)
+            if gen != self._tree_gen or self.current_log_view != view: return
+            self._log_more["prev" if page == "prev" else "next"] = count == LOG_PAGE_ROWS
+            children = self.tree.get_children()
+            # Keep the row that was on top in view instead of jumping to the new rows
+            if page == "prev" and children: self.tree.yview_moveto(added[0] / len(children))
+            if not (children and load_page): return
+            first_key, last_key = self._log_keys.get(children[0]), self._log_keys.get(children[-1])
+            if self._log_more["next"]: self._log_next_page = lambda: load_page(after=last_key)
+            if self._log_more["prev"]: self._log_prev_page = lambda: load_page(before=first_key)
+
+        def work(conn):
+            batch, count = [], 0
+            with conn.cursor(pymysql.cursors.SSCursor) as cur:
+                cur.execute(sql, params)
+                for r in cur:
+                    count += 1
+                    batch.append((row_fn(r) if row_fn else r, key_fn(r) if key_fn else None))
+                    if len(batch) >= STREAM_BATCH_ROWS:
+                        self.result_q.put((append, batch)); batch = []
+            return batch, count
+        self._run_in_background(work, finish, label)
+
+    def _on_log_scroll(self, vsb, first, last):
+        """Log tree yscrollcommand: updates the scrollbar and pulls the next page near the bottom,
+        or the previous (newer) page near the top; one page load at a time."""
+        vsb.set(first, last)
+        if self._log_next_page and float(last) >= 0.95:
+            load = self._log_next_page
+        elif self._log_prev_page and float(first) <= 0.05:
+            load = self._log_prev_page
+        else:
+            return
+        self._log_next_page = self._log_prev_page = None
+        load()
 
     def switch_view(self, view_type):
         """Dynamic Visibility Manager for Region 3."""
@@ -224,111 +441,131 @@ class DopplerApp:
         elif view_type == "plot": 
             self.plot_frame.pack(fill="both", expand=True)
 
+    def _debounced_refresh(self):
+        """Coalesces bursts of refresh requests into one refresh_db_status 200 ms after the last."""
+        if self._refresh_after_id: self.root.after_cancel(self._refresh_after_id)
+        self._refresh_after_id = self.root.after(200, self._do_refresh)
+
+    def _do_refresh(self):
+        self._refresh_after_id = None
+        self.refresh_db_status()
+
     def refresh_db_status(self):
         """Updates global UI counters and synchronizes currently active log."""
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
-                # Aggregate Stats
-                cur.execute("SELECT COUNT(*) as cnt FROM wind_profile_gate")
-                self.lbl_gate_count.config(text=f"Total Gates: {cur.fetchone()['cnt']:,}")
-                cur.execute("SELECT COUNT(*) as cnt FROM vad_gate_fit WHERE status='ok'")
-                self.lbl_uvw_count.config(text=f"UVW Solved: {cur.fetchone()['cnt']:,}")
-                
-                # Time Range Scope
-                cur.execute("SELECT MIN(start_time) as t_min, MAX(start_time) as t_max FROM wind_profile_header")
-                res = cur.fetchone()
-                if res and res['t_min']:
-                    self.lbl_db_info.config(text=f"Database Scope: {res['t_min']} to {res['t_max']}")
-        except Exception as e:
-            logger.error(f"UI Sync Failure: {e}")
-        finally:
-            if conn: conn.close()
+        self._last_refresh = time.monotonic()
+        def query(conn):
+            with conn.cursor(pymysql.cursors.Cursor) as cur:
+                # Aggregate Stats + Time Range Scope in one round trip
+                cur.execute("""SELECT (SELECT COUNT(*) FROM wind_profile_gate) as gates,
+                                      (SELECT COUNT(*) FROM vad_gate_fit WHERE status='ok') as uvw,
+                                      (SELECT MIN(start_time) FROM wind_profile_header) as t_min,
+                                      (SELECT MAX(start_time) FROM wind_profile_header) as t_max""")
+                return cur.fetchone()
+        self._run_in_background(query, self._apply_db_status, "UI Sync Failure")
         
         # Trigger redraw of active content
         if self.current_log_view == "header": self.show_header_log()
         elif self.current_log_view == "date_list": self.handle_view_date_selector()
 
-    def show_header_log(self):
-        """Header Log query with UVW join count."""
-        self.switch_view("header")
-        self.group_log.config(text="Data Log: wind_profile_header")
-        
-        headers = ["Header ID", "Start Time", "Filename", "Gates", "Gate Len (m)", "Proc Runs"]
-        widths = [80, 160, 450, 60, 90, 100]
-        for i, (h, w) in enumerate(zip(headers, widths)):
-            self.tree.heading(f"c{i+1}", text=h); self.tree.column(f"c{i+1}", width=w, anchor="center" if i!=2 else "w")
-        
-        for i in self.tree.get_children(): self.tree.delete(i)
-        
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
-                sql = """SELECT h.header_id, h.start_time, h.filename, h.num_gates, h.range_gate_length_m, 
-                         (SELECT COUNT(DISTINCT run_id) FROM vad_gate_fit f WHERE f.header_id = h.header_id) as proc_run_count
-                         FROM wind_profile_header h ORDER BY h.start_time DESC LIMIT 50"""
-                cur.execute(sql)
-                for r in cur.fetchall():
-                    self.tree.insert("", "end", values=(r['header_id'], r['start_time'], r['filename'], r['num_gates'], r['range_gate_length_m'], r['proc_run_count']))
-        except Exception as e: logger.error(f"Header query fail: {e}")
-        finally:
-            if conn: conn.close()
-
-    def show_proc_run_log(self):
-        """Detailed Process Batch viewer."""
-        self.switch_view("proc")
-        self.group_log.config(text="Data Log: proc_run")
-        headers = ["Run ID", "Rule Tag", "Started At", "Finished At", "Params JSON", ""]
-        widths = [100, 150, 160, 160, 450, 10]
-        for i, (h, w) in enumerate(zip(headers, widths)):
-            self.tree.heading(f"c{i+1}", text=h); self.tree.column(f"c{i+1}", width=w, anchor="center" if i<4 else "w")
+    def _apply_db_status(self, res):
+        gates, uvw, t_min, t_max = res
+        if (gates, uvw) != self._data_version:
+            # Cached plot data and date list are stale
+            stale_dates = self._data_version is not None and self._date_cache is not None
+            self._data_version = (gates, uvw); self._plot_cache.clear()
+            if stale_dates:
+                self._date_cache = None
+                if self.current_log_view == "date_list": self.handle_view_date_selector()
+        self.lbl_gate_count.config(text=f"Total Gates: {gates:,}")
+        self.lbl_uvw_count.config(text=f"UVW Solved: {uvw:,}")
+        if t_min:
+            self.lbl_db_info.config(text=f"Database Scope: {t_min} to {t_max}")
+
+    def show_header_log(self, after=None, before=None):
+        """Header Log query with UVW join count; after=(start_time, header_id) loads the next (older)
+        page, before=(start_time, header_id) the previous (newer) one."""
+        if after is None and before is None:
+            self.switch_view("header")
+            self.group_log.config(text="Data Log: wind_profile_header")
+            
+            self._apply_cols(self._header_cols_cfg)
         
-        for i in self.tree.get_children(): self.tree.delete(i)
+        # Page first (idx_header_time, keyset on start_time/header_id), then count runs for
+        # just the headers on that page (idx_vgf_header_run)
+        # The previous page walks the index upwards (ASC) so it gets the rows just above the tree
+        where, params, order = "", [LOG_PAGE_ROWS], "DESC"
+        if after:
+            where = "WHERE start_time < %s OR (start_time = %s AND header_id < %s)"
+            params = [after[0], after[0], after[1], LOG_PAGE_ROWS]
+        elif before:
+            where, order = "WHERE start_time > %s OR (start_time = %s AND header_id > %s)", "ASC"
+            params = [before[0], before[0], before[1], LOG_PAGE_ROWS]
+        sql = f"""SELECT h.header_id, h.start_time, h.filename, h.num_gates, h.range_gate_length_m, 
+                  COUNT(DISTINCT f.run_id) as proc_run_count
+                  FROM (SELECT header_id, start_time, filename, num_gates, range_gate_length_m
+                        FROM wind_profile_header {where}
+                        ORDER BY start_time {order}, header_id {order} LIMIT %s) h
+                  LEFT JOIN vad_gate_fit f ON f.header_id = h.header_id
+                  GROUP BY h.header_id, h.start_time, h.filename, h.num_gates, h.range_gate_length_m
+                  ORDER BY h.start_time {order}, h.header_id {order}"""
+        self._stream_log(sql, "header", "Header query fail", params, key_fn=lambda r: (r[1], r[0]),
+                         page="next" if after else "prev" if before else None, load_page=self.show_header_log)
+
+    def show_proc_run_log(self, after=None, before=None):
+        """Detailed Process Batch viewer; after=(started_at, run_id) loads the next (older) page,
+        before=(started_at, run_id) the previous (newer) one."""
+        if after is None and before is None:
+            self.switch_view("proc")
+            self.group_log.config(text="Data Log: proc_run")
+            self._apply_cols(self._proc_cols_cfg)
         
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT run_id, rule_tag, started_at, finished_at, params_json FROM proc_run ORDER BY started_at DESC LIMIT 50")
-                for r in cur.fetchall():
-                    self.tree.insert("", "end", values=(r['run_id'], r['rule_tag'], r['started_at'], r['finished_at'], r['params_json'], ""))
-        except Exception as e: logger.error(f"Proc Log Error: {e}")
-        finally:
-            if conn: conn.close()
+        where, params, order = "", [LOG_PAGE_ROWS], "DESC"
+        if after:
+            where = "WHERE started_at < %s OR (started_at = %s AND run_id < %s)"
+            params = [after[0], after[0], after[1], LOG_PAGE_ROWS]
+        elif before:
+            where, order = "WHERE started_at > %s OR (started_at = %s AND run_id > %s)", "ASC"
+            params = [before[0], before[0], before[1], LOG_PAGE_ROWS]
+        sql = f"""SELECT run_id, rule_tag, started_at, finished_at, params_json FROM proc_run {where}
+                  ORDER BY started_at {order}, run_id {order} LIMIT %s"""
+        self._stream_log(sql, "proc", "Proc Log Error", params, row_fn=lambda r: r + ("",), key_fn=lambda r: (r[2], r[0]),
+                         page="next" if after else "prev" if before else None, load_page=self.show_proc_run_log)
 
     def handle_view_date_selector(self):
         """Queries for distinct observation dates and lists them in [YYYY]-[MM]-[DD] format."""
         self.switch_view("date_list")
         self.group_log.config(text="Observation Date Selection")
         self.date_listbox.delete(0, tk.END)
+        # The DISTINCT DATE() scan only reruns after the data changed (see _date_cache resets)
+        if self._date_cache is not None:
+            self._fill_date_list(self._date_cache)
+            return
         
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
-                sql = """SELECT DISTINCT DATE(h.start_time) as d FROM vad_gate_fit f 
-                         JOIN wind_profile_header h ON f.header_id = h.header_id 
-                         WHERE f.status = 'ok' ORDER BY d DESC"""
+        def query(conn):
+            with conn.cursor(pymysql.cursors.Cursor) as cur:
+                # Walk headers by idx_header_date and probe idx_vgf_status_run once per header,
+                # instead of joining every solved gate row before the DISTINCT
+                sql = """SELECT DISTINCT DATE(h.start_time) as d FROM wind_profile_header h
+                         WHERE EXISTS (SELECT 1 FROM vad_gate_fit f
+                                       WHERE f.status = 'ok' AND f.header_id = h.header_id)
+                         ORDER BY d DESC"""
                 cur.execute(sql)
-                rows = cur.fetchall()
-                for r in rows:
-                    date_str = r['d'].strftime('%Y-%m-%d')
-                    self.date_listbox.insert(tk.END, f" {date_str} ")
-            if self.date_listbox.size() == 0: self.date_listbox.insert(tk.END, " (No solved VAD data found) ")
-        except Exception as e: logger.error(f"Discovery Error: {e}")
-        finally:
-            if conn: conn.close()
+                return [d.strftime('%Y-%m-%d') for (d,) in cur.fetchall()]
+        self._run_in_background(query, self._fill_date_list, "Discovery Error")
+
+    def _fill_date_list(self, dates):
+        self._date_cache = dates
+        if self.current_log_view != "date_list": return
+        self.date_listbox.delete(0, tk.END)
+        if dates: self.date_listbox.insert(tk.END, *(f" {d} " for d in dates))
+        else: self.date_listbox.insert(tk.END, " (No solved VAD data found) ")
 
     def on_date_selected(self, event):
-        """Binding for selecting a date. Ensures highlight is seen before transition."""
+        """Binding for selecting a date; plots it straight away."""
         sel = self.date_listbox.curselection()
         if not sel: return
         raw = self.date_listbox.get(sel[0]).strip()
-        self.root.update_idletasks()
-        if len(raw) == 10: 
-            self.root.after(100, lambda: self.handle_plot_for_date(raw))
+        if len(raw) == 10: self.handle_plot_for_date(raw)
 
     def handle_plot_for_date(self, date_str):
         """Renders the plot for a specific 24h window in Region 3 area."""
@@ -336,20 +573,45 @@ class DopplerApp:
         m = force_load_module("plot_wind_profile")
         if not m: return
         
-        df = m.get_wind_data(start_date=start_ts, end_date=end_ts)
+        # Re-plotting a day replots from memory until the counters show new data
+        key = (start_ts, end_ts, self._data_version)
+        if key in self._plot_cache:
+            self._plot_cache.move_to_end(key)
+            self._render_plot(m, self._plot_cache[key], date_str, start_ts, end_ts)
+            return
+
+        def loaded(df):
+            if not df.empty:
+                self._plot_cache[key] = df
+                while len(self._plot_cache) > PLOT_CACHE_DAYS: self._plot_cache.popitem(last=False)
+            self._render_plot(m, df, date_str, start_ts, end_ts)
+        # The SELECT runs off the Tk thread; figure construction happens back on it
+        self._run_in_background(lambda: m.get_wind_data(start_date=start_ts, end_date=end_ts),
+                                loaded, "Plot Data Error", use_db=False)
+
+    def _render_plot(self, m, df, date_str, start_ts, end_ts):
+        if self.current_log_view != "date_list": return
         if df.empty: messagebox.showwarning("No Data", f"No wind data found for {date_str}"); return
         
         self.switch_view("plot")
         self.group_log.config(text=f"Wind Profile Plot: {date_str} (UTC)")
-        for w in self.plot_frame.winfo_children(): w.destroy()
         
         try:
-            fig = m.create_wind_figure(df, start_ts, end_ts)
-            self.canvas_widget = FigureCanvasTkAgg(fig, master=self.plot_frame)
-            self.canvas_widget.draw()
-            self.toolbar_widget = NavigationToolbar2Tk(self.canvas_widget, self.plot_frame); self.toolbar_widget.update()
-            ttk.Button(self.plot_frame, text="⬅ Return to Selection", command=self.handle_view_date_selector).pack(side="top", pady=5)
-            self.canvas_widget.get_tk_widget().pack(fill="both", expand=True)
+            # Canvas, toolbar and figure are built once; later plots redraw onto the same Figure
+            if self.canvas_widget is None:
+                # Matplotlib embedding dependencies are only imported once the first plot is shown
+                from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+                from matplotlib.figure import Figure
+                fig = Figure(figsize=m.FIG_SIZE, dpi=m.DPI)
+                self.canvas_widget = FigureCanvasTkAgg(fig, master=self.plot_frame)
+                self.toolbar_widget = NavigationToolbar2Tk(self.canvas_widget, self.plot_frame); self.toolbar_widget.update()
+                ttk.Button(self.plot_frame, text="⬅ Return to Selection", command=self.handle_view_date_selector).pack(side="top", pady=5)
+                self.canvas_widget.get_tk_widget().pack(fill="both", expand=True)
+            if m.create_wind_figure(df, start_ts, end_ts, fig=self.canvas_widget.figure) is None:
+                messagebox.showwarning("No Data", f"No valid wind barbs to plot for {date_str}")
+                self.handle_view_date_selector(); return
+            self.toolbar_widget.update()  # reset the zoom/pan history for the new day
+            self.canvas_widget.draw_idle()
         except Exception as e: messagebox.showerror("Plotting Error", str(e))
 
     # --- PIPELINE WRAPPERS ---
@@ -360,69 +622,95 @@ class DopplerApp:
         if not m: 
             messagebox.showerror("Module Error", "Could not find dooplerInsert_v3.py in the current directory.")
             return
-        try: 
-            m.main()
-            self.refresh_db_status()
-        except Exception as e: messagebox.showerror("Error", str(e))
+        # The folder picker is a dialog, so it stays on the Tk thread; only the import runs in the worker
+        folder = filedialog.askdirectory(parent=self.root, title="Select folder with .hpl files")
+        if not folder: return
+        self._run_pipeline(lambda: m.main(folder), "Error")
 
     def handle_qc(self):
         m = force_load_module("qc_tagging_v2")
         if not m: return
-        try: m.main(); self.refresh_db_status(); messagebox.showinfo("Success", "QC Evaluation Finished.")
-        except Exception as e: messagebox.showerror("Error", str(e))
+        self._run_pipeline(m.main, "Error", "QC Evaluation Finished.")
 
     def handle_uvw(self):
         # Sync with actual filename: wind_profile_uvw_v2.py
         m = force_load_module("wind_profile_uvw_v2")
         if not m: return
-        try:
-            if hasattr(m, 'main'): m.main(); self.refresh_db_status(); messagebox.showinfo("Success", "VAD Calculations Complete.")
-            else: messagebox.showerror("Error", "The UVW script is missing a 'main()' function entry point.")
-        except Exception as e: messagebox.showerror("Execution Error", str(e))
+        if not hasattr(m, 'main'):
+            messagebox.showerror("Error", "The UVW script is missing a 'main()' function entry point."); return
+        self._run_pipeline(m.main, "Execution Error", "VAD Calculations Complete.")
+
+    def _run_pipeline(self, run, error_title, done_msg=None):
+        """Runs a pipeline step on the executor so the window keeps repainting; the step
+        buttons stay disabled until it finishes, so steps never overlap."""
+        buttons = (self.btn_insert, self.btn_qc, self.btn_uvw)
+        for b in buttons: b.state(["disabled"])
+        def done(changed):
+            for b in buttons: b.state(["!disabled"])
+            self._refresh_after_pipeline(changed)
+            if done_msg: messagebox.showinfo("Success", done_msg)
+        def failed(e):
+            for b in buttons: b.state(["!disabled"])
+            messagebox.showerror(error_title, str(e))
+        self._run_in_background(run, done, error_title, use_db=False, on_error=failed)
+
+    def _refresh_after_pipeline(self, changed):
+        """Skips the counter refresh when a pipeline step wrote nothing and the labels are fresh;
+        the Sync All Logs button always schedules a refresh."""
+        if changed: self._date_cache = None
+        if not (changed or 0) and time.monotonic() - self._last_refresh < 2: return
+        self._debounced_refresh()
 
     def handle_view_header_log(self): self.show_header_log()
     def handle_view_proc_run(self): self.show_proc_run_log()
 
     # --- RULE MANAGEMENT & INTERACTIVE TOGGLE ---
 
-    def load_rules(self):
-        """Loads and syncs the vad_rule_qc table with row-level visual styling."""
-        for item in self.rule_tree.get_children(): self.rule_tree.delete(item)
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
+    def load_rules(self, max_age=0):
+        """Loads and syncs the vad_rule_qc table with row-level visual styling.
+        With max_age, a SELECT issued less than max_age seconds ago (done or in flight) is reused."""
+        now = time.monotonic()
+        if max_age and now - self._rules_loaded_at < max_age: return
+        self._rules_loaded_at = now
+        def query(conn):
+            with conn.cursor(pymysql.cursors.Cursor) as cur:
                 cur.execute("SELECT rule_id, def_name, rule_code, is_active, rule_order, description FROM vad_rule_qc ORDER BY rule_order")
-                for r in cur.fetchall():
-                    is_active = r['is_active']
-                    status_text = "ACTIVE" if is_active else "INACTIVE"
-                    row_tag = 'active_row' if is_active else 'inactive_row'
-                    
-                    self.rule_tree.insert("", "end", values=(
-                        r['rule_id'], r['def_name'], r['rule_code'], status_text, r['rule_order'], r['description']
-                    ), tags=(row_tag,))
-        except Exception as e: logger.error(f"Rule Loader Error: {e}")
-        finally:
-            if conn: conn.close()
+                return cur.fetchall()
+        self._run_in_background(query, self._fill_rules, "Rule Loader Error")
+
+    def _fill_rules(self, rows):
+        # Staged (uncommitted) descriptions stay visible across reloads
+        pending = self._pending_rule_updates
+        rows = [(rid, name, code, active, order, pending.get(rid, desc)) for rid, name, code, active, order, desc in rows]
+        self._rule_cache = {rid: {"def_name": name, "rule_code": code, "is_active": active, "rule_order": order, "description": desc}
+                            for rid, name, code, active, order, desc in rows}
+        values = [(rid, name, code, "ACTIVE" if active else "INACTIVE", order, desc)
+                  for rid, name, code, active, order, desc in rows]
+        tags = [_ACTIVE_TAG if r[3] else _INACTIVE_TAG for r in rows]
+        self._reload_tree(self.rule_tree, values, tags)
 
     def handle_rule_click(self, event):
         """Detects click on any row to switch rule activity status in database."""
-        region = self.rule_tree.identify_region(event.x, event.y)
-        if region != "cell": return
-        item_id = self.rule_tree.identify_row(event.y)
+        item_id = self.rule_tree.identify_row(event.y)  # empty for headings/blank space
         if not item_id: return
         
         rid = self.rule_tree.item(item_id)['values'][0]
-        db = None
-        try:
-            db = self._get_db_conn()
-            with db.cursor() as cur:
+        # Flip the row right away; the UPDATE runs in the background and is only undone on failure
+        def paint(active):
+            self.rule_tree.item(item_id, tags=_ACTIVE_TAG if active else _INACTIVE_TAG)
+            self.rule_tree.set(item_id, "status", "ACTIVE" if active else "INACTIVE")
+            if rid in self._rule_cache: self._rule_cache[rid]["is_active"] = int(active)
+        was_active = 'active_row' in self.rule_tree.item(item_id, 'tags')
+        paint(not was_active)
+
+        def toggle(conn):
+            with conn.cursor() as cur:
                 cur.execute("UPDATE vad_rule_qc SET is_active = NOT is_active WHERE rule_id = %s", (rid,))
-            db.commit()
-            self.load_rules() 
-        except Exception as e: messagebox.showerror("Toggle Error", str(e))
-        finally:
-            if db: db.close()
+            conn.commit()
+        def failed(e):
+            if self.rule_tree.exists(item_id): paint(was_active)
+            messagebox.showerror("Toggle Error", str(e))
+        self._run_in_background(toggle, lambda _: None, "Toggle Error", on_error=failed)
 
     def handle_edit_desc(self):
         """Restores modal popup for detailed rule description editing."""
@@ -435,32 +723,63 @@ class DopplerApp:
         popup = tk.Toplevel(self.root); popup.title(f"Edit ID {rid}"); popup.geometry("600x450")
         popup.transient(self.root); popup.grab_set()
 
-        curr_desc = ""
-        conn = None
-        try:
-            conn = self._get_db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT description FROM vad_rule_qc WHERE rule_id = %s", (rid,))
-                res = cur.fetchone()
-                if res: curr_desc = res['description']
-        except Exception: pass
-        finally:
-            if conn: conn.close()
+        # The description comes from the rule cache filled by load_rules; no DB round trip
+        curr_desc = self._rule_cache.get(rid, {}).get("description", "")
 
         tk.Label(popup, text=f"Update Description for Rule {rid}:", font=("Arial", 10, "bold")).pack(pady=10)
         txt = tk.Text(popup, height=12, width=65, wrap="word", padx=10, pady=10)
         txt.insert("1.0", str(curr_desc)); txt.pack(padx=20, pady=10)
 
         def save():
-            val = txt.get("1.0", "end-1c").strip(); db = None
-            try:
-                db = self._get_db_conn()
-                with db.cursor() as cur: cur.execute("UPDATE vad_rule_qc SET description = %s WHERE rule_id = %s", (val, rid))
-                db.commit(); messagebox.showinfo("Success", "Updated."); popup.destroy(); self.load_rules()
-            except Exception as ex: messagebox.showerror("SQL Error", str(ex))
-            finally:
-                if db: db.close()
-        ttk.Button(popup, text="💾 Save Definition", command=save).pack(pady=15)
+            # Staged only; Commit Edits writes every staged description in one UPDATE
+            val = txt.get("1.0", "end-1c").strip()
+            self._pending_rule_updates[rid] = val
+            if rid in self._rule_cache: self._rule_cache[rid]["description"] = val
+            self.rule_tree.set(selection[0], "desc", val)
+            self.btn_commit_desc.config(text=f"💾 Commit Edits ({len(self._pending_rule_updates)})")
+            popup.destroy()
+        ttk.Button(popup, text="💾 Stage Definition", command=save).pack(pady=15)
+
+    def handle_commit_desc_edits(self, on_committed=None):
+        """Writes all staged rule descriptions with a single UPDATE ... CASE rule_id statement
+        (in the background); on_committed runs on the Tk thread once the write succeeded."""
+        pending = dict(self._pending_rule_updates)  # snapshot; edits staged meanwhile stay pending
+        if not pending:
+            messagebox.showinfo("Nothing to Commit", "No staged description edits.")
+            return
+        case_sql = " ".join(["WHEN %s THEN %s"] * len(pending))
+        in_sql = ", ".join(["%s"] * len(pending))
+        sql = f"UPDATE vad_rule_qc SET description = CASE rule_id {case_sql} END WHERE rule_id IN ({in_sql})"
+        params = [v for item in pending.items() for v in item] + list(pending)
+        self.btn_commit_desc.state(["disabled"])
+
+        def write(conn):
+            with conn.cursor() as cur: cur.execute(sql, params)
+            conn.commit()
+        def done(_):
+            for rid, val in pending.items():
+                if self._pending_rule_updates.get(rid) == val: del self._pending_rule_updates[rid]
+            self.btn_commit_desc.state(["!disabled"])
+            self.btn_commit_desc.config(text=f"💾 Commit Edits ({len(self._pending_rule_updates)})")
+            self._rules_loaded_at = 0.0
+            if on_committed: return on_committed()
+            messagebox.showinfo("Success", f"Updated {len(pending)} rule description(s).")
+            self.load_rules()
+        def failed(e):
+            self.btn_commit_desc.state(["!disabled"])
+            messagebox.showerror("SQL Error", str(e))
+        self._run_in_background(write, done, "Rule Description Commit Error", on_error=failed)
+
+    def on_close(self):
+        """Window close: staged rule descriptions are committed or discarded on request, never dropped silently."""
+        n = len(self._pending_rule_updates)
+        if n:
+            answer = messagebox.askyesnocancel(
+                "Uncommitted Edits", f"{n} staged rule description edit(s) are not committed.\n\n"
+                "Yes: commit and close   No: discard and close   Cancel: keep editing")
+            if answer is None: return
+            if answer: return self.handle_commit_desc_edits(on_committed=self.root.destroy)
+        self.root.destroy()
 
 if __name__ == "__main__":
     app_root = tk.Tk()
@@ -4,10 +4,12 @@
 # Version: 6.2 (Dashboard Region 3 Integration + Agg/TkAgg Backend Management)
 
 import matplotlib
+import os
 import sys
+import threading
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.cm as cm
@@ -35,15 +37,41 @@ BARB_LINEWIDTH = 1.2
 BARB_LENGTH = 6.5
 VMAX_SPEED = 25.0        # Max speed for color mapping scale (m/s)
 
+# Standalone runs: with DOOPLER_HEADLESS set, main() saves PLOT_OUTPUT_PNG instead of opening a window
+HEADLESS = bool(os.environ.get("DOOPLER_HEADLESS"))
+PLOT_OUTPUT_PNG = "latest_wind_plot.png"
+
+# get_wind_data streams its result (unbuffered cursor) and converts it this many rows at a time
+READ_CHUNK_ROWS = 50_000
+
+# Column types for get_wind_data: float32 holds the 0.01 m/s wind precision and halves the frame
+WIND_DTYPES = {'range_gate_index': 'int16', 'gate_len': 'float32',
+               'u_ms': 'float32', 'v_ms': 'float32', 'speed_ms': 'float32'}
+
 # =============================================================================
 # 2. DATA ACQUISITION
 # =============================================================================
 
+# One engine (and its connection pool) per process; plots may run on Dashboard worker threads.
+# The Dashboard importlib.reload()s this module after edits, which re-runs it in the same namespace:
+# the previous engine is kept, or disposed when DB_CONNECTION_STR changed, so no pool is orphaned.
+_engine = globals().get("_engine")
+_engine_lock = globals().get("_engine_lock") or threading.Lock()
+if _engine is not None and _engine.url.render_as_string(hide_password=False) != DB_CONNECTION_STR:
+    _engine.dispose()
+    _engine = None
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(DB_CONNECTION_STR, pool_size=5, pool_pre_ping=True, pool_recycle=1800)
+    return _engine
+
 def get_wind_data(start_date=None, end_date=None):
     """Retrieves processed VAD fit data from MySQL for the specified range."""
     try:
-        engine = create_engine(DB_CONNECTION_STR)
-        
         # Base query joining retrieval results with file headers
         sql = """
             SELECT 
@@ -55,16 +83,24 @@ def get_wind_data(start_date=None, end_date=None):
             WHERE f.status = 'ok' 
               AND f.speed_ms IS NOT NULL 
               AND f.speed_ms < 100
+              AND f.range_gate_index <= :max_gate
+              AND MOD(f.range_gate_index, :gate_step) = 0
         """
+        params = {"max_gate": MAX_HEIGHT_GATES, "gate_step": BARB_GATE_INTERVAL}
         
         # Dashboard-driven date filtering
         if start_date and end_date:
-            sql += f" AND h.start_time BETWEEN '{start_date}' AND '{end_date}'"
+            sql += " AND h.start_time BETWEEN :start AND :end"
+            params.update(start=start_date, end=end_date)
         
         sql += " ORDER BY h.start_time, f.range_gate_index"
         
-        with engine.connect() as conn:
-            return pd.read_sql(sql, conn)
+        # stream_results gives an unbuffered server-side cursor, so only one chunk of raw rows
+        # is held in Python at a time instead of the whole multi-day result set
+        with _get_engine().connect().execution_options(stream_results=True) as conn:
+            chunks = list(pd.read_sql(text(sql), conn, params=params, parse_dates=['start_time'],
+                                      dtype=WIND_DTYPES, chunksize=READ_CHUNK_ROWS))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
     except Exception as e:
         print(f"CRITICAL: DB Read Error in Plotter: {e}")
         return pd.DataFrame()
@@ -73,65 +109,76 @@ def get_wind_data(start_date=None, end_date=None):
 # 3. VISUALIZATION ENGINE (Dashboard Embedding Entry Point)
 # =============================================================================
 
-def create_wind_figure(df, start_date_str=None, end_date_str=None):
+# Speed colour scale shared by the speed underlay and the colorbar
+SPEED_CMAP = plt.get_cmap('jet')
+SPEED_NORM = mcolors.Normalize(vmin=0, vmax=VMAX_SPEED)
+BARB_COLOR = 'k'
+# Time-axis tick labels; DateFormatter keeps no per-axis state, so one instance serves every redraw
+TIME_FORMATTER = mdates.DateFormatter('%H:%M')
+
+def draw_wind(ax, df, start_date_str=None, end_date_str=None):
     """
-    Constructs a Matplotlib Figure object specifically for dashboard embedding.
-    Returns the Figure object to the caller (dooplerDashboard.py).
+    Clears 'ax' and draws the barb profile onto it. The axes (and a colorbar
+    attached to them) are reused, so repeated dashboard plots only redraw data.
+    Returns None, leaving 'ax' untouched, when no sampled cell has a valid wind.
     """
-    if df.empty:
-        return None
-
     # --- A. Data Preprocessing ---
-    # Calculate Height Above Ground Level (AGL) for the Y-axis
-    df['height_m'] = (df['range_gate_index'] + 0.5) * df['gate_len']
-    
-    # Filter vertical range
-    df = df[df['range_gate_index'] <= MAX_HEIGHT_GATES]
+    first_time, last_time = df['start_time'].min(), df['start_time'].max()
 
-    # Reshape data into grids for mesh plotting
-    pivot_speed = df.pivot_table(index='height_m', columns='start_time', values='speed_ms')
-    pivot_u = df.pivot_table(index='height_m', columns='start_time', values='u_ms')
-    pivot_v = df.pivot_table(index='height_m', columns='start_time', values='v_ms')
-    
-    times = pivot_speed.columns
-    heights = pivot_speed.index
+    # --- B. Subsampling ---
+    # Downsample before reshaping so wind barbs do not overlap and only plotted cells are
+    # gridded: every BARB_INTERVAL-th scan here, every BARB_GATE_INTERVAL-th gate in get_wind_data
+    scan_times = df['start_time'].drop_duplicates().sort_values()
+    df = df[df['start_time'].isin(scan_times.iloc[::BARB_INTERVAL])]
+
+    # Height Above Ground Level (AGL) for the Y-axis, only for the kept rows
+    height_m = (df['range_gate_index'].to_numpy() + 0.5) * df['gate_len'].to_numpy()
+
+    # Scatter the rows straight into (height, time) grids: np.unique gives each row its cell,
+    # bincount sums per cell. The mean only matters when several proc runs solved the same
+    # header/gate; NaNs are left out of it, as groupby().mean() would.
+    t_keys, t_idx = np.unique(df['start_time'].to_numpy(), return_inverse=True)
+    h_keys, h_idx = np.unique(height_m, return_inverse=True)
+    cell, n_cells = h_idx * t_keys.size + t_idx, h_keys.size * t_keys.size
+    # Each mean is written straight into one float32 (3, cells) block; no float64 stack is kept
+    grids = np.empty((3, n_cells), dtype=np.float32)
+    for k, col in enumerate(('speed_ms', 'u_ms', 'v_ms')):
+        vals = df[col].to_numpy(dtype=np.float64)
+        seen = ~np.isnan(vals)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(np.bincount(cell, np.where(seen, vals, 0.0), n_cells), np.bincount(cell, seen, n_cells),
+                      out=grids[k], casting='same_kind')
+    s_vals, u_vals, v_vals = grids.reshape(3, h_keys.size, t_keys.size)
     
-    # Create coordinate matrices (converting times to numeric for matplotlib)
-    X, Y = np.meshgrid(mdates.date2num(times), heights)
-
-    # --- B. Figure Construction ---
-    fig, ax = plt.subplots(figsize=FIG_SIZE, dpi=DPI)
-    cmap = plt.get_cmap('jet')
-    norm = mcolors.Normalize(vmin=0, vmax=VMAX_SPEED)
-
-    # --- C. Subsampling ---
-    # Downsample the grid to ensure wind barbs do not overlap
-    s_t, s_h = BARB_INTERVAL, BARB_GATE_INTERVAL
-    u_vals = pivot_u.values[::s_h, ::s_t]
-    v_vals = pivot_v.values[::s_h, ::s_t]
-    s_vals = pivot_speed.values[::s_h, ::s_t]
+    # 1-D coordinate axes (times converted to numeric for matplotlib)
+    t_num = mdates.date2num(t_keys)
+    h_num = h_keys
     
-    # Identify valid data points (exclude NaNs)
-    valid_mask = ~np.isnan(u_vals) & ~np.isnan(v_vals) & ~np.isnan(s_vals)
+    # Identify valid data points (a NaN in any field propagates through the sum)
+    valid_mask = np.isfinite(u_vals + v_vals + s_vals)
+    yi, xi = np.nonzero(valid_mask)
+    if not len(yi):
+        return None
+    ax.clear()
     
-    # --- D. Rendering ---
-    # Draw Bold Colored Barbs
-    ax.barbs(X[::s_h, ::s_t][valid_mask], Y[::s_h, ::s_t][valid_mask], 
-             u_vals[valid_mask], v_vals[valid_mask], 
-             color=cmap(norm(s_vals[valid_mask])),
+    # --- C. Rendering ---
+    # Speed field as one QuadMesh underlay (cells without a valid wind stay blank)
+    ax.pcolormesh(t_num, h_num, np.ma.masked_where(~valid_mask, s_vals),
+                  cmap=SPEED_CMAP, norm=SPEED_NORM, shading='nearest')
+
+    # Single-colour barbs on top
+    ax.barbs(t_num[xi], h_num[yi], 
+             u_vals[yi, xi], v_vals[yi, xi], 
+             color=BARB_COLOR,
              length=BARB_LENGTH, 
              linewidth=BARB_LINEWIDTH, 
              pivot='middle',
              sizes=dict(emptybarb=0.0))
 
-    # --- E. Formatting & Colorbar ---
-    sm = cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    plt.colorbar(sm, ax=ax, label='Horizontal Wind Speed (m/s)')
-
+    # --- D. Formatting ---
     # Labels and Titles
-    title_date = times[0].strftime("%Y-%m-%d")
-    ax.set_title(f'Lidar VAD Wind Profile: {title_date}\n{times[0].strftime("%H:%M")} to {times[-1].strftime("%H:%M")} (UTC)')
+    title_date = first_time.strftime("%Y-%m-%d")
+    ax.set_title(f'Lidar VAD Wind Profile: {title_date}\n{first_time.strftime("%H:%M")} to {last_time.strftime("%H:%M")} (UTC)')
     ax.set_ylabel('Height AGL (m)')
     ax.set_xlabel('Time (UTC)')
     
@@ -140,26 +187,61 @@ def create_wind_figure(df, start_date_str=None, end_date_str=None):
     
     # Axis Handling
     ax.xaxis_date()
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax.xaxis.set_major_formatter(TIME_FORMATTER)
+    return ax
+
+def create_wind_figure(df, start_date_str=None, end_date_str=None, fig=None):
+    """
+    Constructs a Matplotlib Figure object specifically for dashboard embedding.
+    When 'fig' is given (the Dashboard's persistent canvas figure) its plot axes
+    and colorbar are created on first use and only redrawn afterwards.
+    Returns the Figure object to the caller (dooplerDashboard.py).
+    """
+    if df.empty:
+        return None
+
+    # --- Figure Construction (axes + colorbar are static across redraws) ---
+    owns_fig = fig is None
+    if owns_fig:
+        fig, ax = plt.subplots(figsize=FIG_SIZE, dpi=DPI)
+    elif fig.axes:
+        ax = fig.axes[0]
+    else:
+        ax = fig.add_subplot()
+
+    # Nothing to draw after subsampling/NaN filtering: skip colorbar and layout work
+    if draw_wind(ax, df, start_date_str, end_date_str) is None:
+        if owns_fig:
+            plt.close(fig)
+        return None
+
+    if len(fig.axes) == 1:
+        sm = cm.ScalarMappable(cmap=SPEED_CMAP, norm=SPEED_NORM)
+        sm.set_array([])
+        fig.colorbar(sm, ax=ax, label='Horizontal Wind Speed (m/s)')
+
     fig.autofmt_xdate()
-    
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 # =============================================================================
 # 4. STANDALONE EXECUTION (Standalone Mode)
 # =============================================================================
 
-def main(start_date=None, end_date=None):
+def main(start_date=None, end_date=None, show=None):
     """
     Entry point for standalone execution. 
-    Switches backend to TkAgg to allow an interactive popup window.
+    With show (default: not HEADLESS) switches backend to TkAgg for an interactive popup window;
+    otherwise stays on Agg and writes the plot to PLOT_OUTPUT_PNG.
     """
-    try:
-        # Re-enable interactive backend for local testing
-        plt.switch_backend('TkAgg')
-    except Exception as e:
-        print(f"Warning: Could not switch to interactive backend: {e}")
+    if show is None:
+        show = not HEADLESS
+    if show:
+        try:
+            # Re-enable interactive backend for local testing (Tk init is only paid here)
+            plt.switch_backend('TkAgg')
+        except Exception as e:
+            print(f"Warning: Could not switch to interactive backend: {e}")
 
     # Fetch all data if no dates provided
     df = get_wind_data(start_date, end_date)
@@ -167,8 +249,12 @@ def main(start_date=None, end_date=None):
     if not df.empty:
         print(f"Generating plot for {len(df)} data points...")
         fig = create_wind_figure(df)
-        if fig:
+        if fig and show:
             plt.show()
+        elif fig:
+            fig.savefig(PLOT_OUTPUT_PNG, bbox_inches='tight')
+            plt.close(fig)
+            print(f"Plot saved to {PLOT_OUTPUT_PNG}")
     else:
         print("No processed wind data found in the database.")
 
@@ -2,12 +2,17 @@
 # qc_tagging_v2.py
 # Version: 2.3 (Dashboard Integrated + Single Line Progress)
 
-import math
+import multiprocessing
+import os
 import sys
+import time
 import pymysql
 import logging
 import re
+import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Tuple, Any
 
 # =========================
@@ -34,6 +39,21 @@ BIN_DEG = 10.0
 MIN_NONEMPTY_BINS = 3      
 VERT_THR = 2.0             
 NEIGHBOR_STEP = 1          
+FETCH_HEADERS = 50         # headers whose header/gate rows are read per SELECT pair
+PROGRESS_INTERVAL_S = 0.2  # min seconds between progress-line rewrites
+QC_WORKERS = os.cpu_count() or 1  # processes evaluating headers (DB reads/writes stay on the main process)
+
+# Tag write-back keyed on uq_gate_triplet. pymysql's executemany folds an INSERT ... VALUES
+# into multi-row statements (split below its max_stmt_length, well under max_allowed_packet),
+# so a header's tags go out in a few round trips instead of one UPDATE per gate row.
+QC_TAG_UPSERT_SQL = """
+    INSERT INTO wind_profile_gate
+      (header_id, range_gate_index, ray_idx, qc_selected, qc_failed_rules_csv, qc_failed_rule_count)
+    VALUES (%s,%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE
+        qc_selected=VALUES(qc_selected), qc_failed_rules_csv=VALUES(qc_failed_rules_csv),
+        qc_failed_rule_count=VALUES(qc_failed_rule_count)
+"""
 
 # =========================
 # Config (Matches doopler.sql)
@@ -62,23 +82,10 @@ def safe_float(x, default=None):
     except:
         return default
 
-def median(values):
-    vals = sorted(values)
-    n = len(vals)
-    if n == 0: return None
-    mid = n // 2
-    return vals[mid] if n % 2 == 1 else 0.5 * (vals[mid-1] + vals[mid])
-
-def mad(values, med=None):
-    if not values: return None
-    if med is None: med = median(values)
-    dev = [abs(v - med) for v in values]
-    return median(dev)
-
 def norm360(a):
-    if a is None: return None
-    a = float(a) % 360.0
-    return 0.0 if (abs(a - 360.0) <= AZ_DUP_TOL or abs(a) <= AZ_DUP_TOL) else a
+    """Azimuths (array, NaN = missing) wrapped to [0, 360), with values within AZ_DUP_TOL of north set to 0"""
+    a = np.asarray(a, dtype=float) % 360.0
+    return np.where((np.abs(a - 360.0) <= AZ_DUP_TOL) | (np.abs(a) <= AZ_DUP_TOL), 0.0, a)
 
 def circular_span_deg(unique_az_deg):
     n = len(unique_az_deg)
@@ -87,89 +94,72 @@ def circular_span_deg(unique_az_deg):
     gaps = [(s[(i+1) % n] - s[i]) % 360.0 for i in range(n)]
     return 360.0 - max(gaps)
 
-def snap_azimuths_per_gate(rows_for_gate, tol=AZ_DUP_TOL):
-    tmp = []
-    for r in rows_for_gate:
-        az = norm360(r.get('azimuth_deg'))
-        tmp.append((r['range_gate_index'], r['ray_idx'], az))
-    tmp.sort(key=lambda x: (9999.0 if x[2] is None else x[2]))
-
-    seen, canon_by_rowkey, dup_by_rowkey = [], {}, {}
-    for gi, ray_idx, az in tmp:
-        key = (gi, ray_idx)
-        if az is None:
-            dup_by_rowkey[key] = True; canon_by_rowkey[key] = None; continue
-        rep = next((c for c in seen if min(abs(az-c), 360-abs(az-c)) <= tol), None)
-        if rep is None:
-            seen.append(az); canon_by_rowkey[key] = az; dup_by_rowkey[key] = False
+def snap_azimuths_per_gate(az_sorted, tol=AZ_DUP_TOL):
+    """Duplicate mask and canonical (first-seen) azimuths for one gate's ascending azimuths (NaN last)"""
+    dup, seen = np.isnan(az_sorted), []
+    for i, az in enumerate(az_sorted.tolist()):
+        if dup[i]: continue
+        if any(min(abs(az-c), 360-abs(az-c)) <= tol for c in seen):
+            dup[i] = True
         else:
-            canon_by_rowkey[key] = rep; dup_by_rowkey[key] = True
-    return canon_by_rowkey, dup_by_rowkey, sorted(seen)
+            seen.append(az)
+    return dup, seen
 
 # ----------------------
 # Rule Functions
 # ----------------------
+# Each rule sees a whole header at once: 'cols' holds one float array per gate row field
+# (NULL -> NaN, see gate_columns) and 'ctx' the row-aligned arrays from precompute_gate_context.
+# A rule returns a boolean pass mask over the header's rows.
 @register('check_nulls')
-def check_nulls(row, ctx):
-    for key in ('doppler_ms','azimuth_deg','elevation_deg'):
-        if row.get(key) is None: return False, f"{key}=NULL"
-    return True, None
+def check_nulls(cols, ctx):
+    return ~(np.isnan(cols['doppler_ms']) | np.isnan(cols['azimuth_deg']) | np.isnan(cols['elevation_deg']))
 
 @register('check_snr_min')
-def check_snr_min(row, ctx):
-    snr = safe_float(row.get('intensity_snr_plus1'), 1.0) - 1.0
-    return (snr >= SNR_MIN), None if (snr >= SNR_MIN) else f"snr={snr:.3f}"
+def check_snr_min(cols, ctx):
+    snr = np.nan_to_num(cols['intensity_snr_plus1'], nan=1.0) - 1.0
+    return snr >= SNR_MIN
 
 @register('check_spectral_width_max')
-def check_spectral_width_max(row, ctx):
-    sw = safe_float(row.get('spectral_width_ms'), 0.0)
+def check_spectral_width_max(cols, ctx):
     instr_sw = safe_float(ctx.get('instrument_spectral_width_ms'), 0.0)
     thr = K_SW * (instr_sw if instr_sw > 0 else 1.0)
-    return (sw <= thr), None if (sw <= thr) else f"sw={sw:.3f}"
+    return np.nan_to_num(cols['spectral_width_ms'], nan=0.0) <= thr
 
 @register('check_pitch_roll_max')
-def check_pitch_roll_max(row, ctx):
-    m = max(abs(safe_float(row.get('pitch_deg'), 0.0)), abs(safe_float(row.get('roll_deg'), 0.0)))
-    return (m <= TILT_ABS_MAX), None if (m <= TILT_ABS_MAX) else f"tilt={m:.2f}"
+def check_pitch_roll_max(cols, ctx):
+    m = np.maximum(np.abs(np.nan_to_num(cols['pitch_deg'], nan=0.0)), np.abs(np.nan_to_num(cols['roll_deg'], nan=0.0)))
+    return m <= TILT_ABS_MAX
 
 @register('check_elevation_range')
-def check_elevation_range(row, ctx):
-    elev = safe_float(row.get('elevation_deg'))
-    ok = (elev is not None and ELEV_MIN <= elev <= ELEV_MAX)
-    return ok, None if ok else "elev_out"
+def check_elevation_range(cols, ctx):
+    elev = cols['elevation_deg']  # NaN compares False, so NULL fails
+    return (elev >= ELEV_MIN) & (elev <= ELEV_MAX)
 
 @register('check_azimuth_duplicate_guard')
-def check_azimuth_duplicate_guard(row, ctx):
-    is_dup = ctx.get('az_dup_by_rowkey', {}).get((row['range_gate_index'], row['ray_idx']), False)
-    return (not is_dup), None if not is_dup else "dup_az"
+def check_azimuth_duplicate_guard(cols, ctx):
+    return ~ctx['az_dup']
 
 @register('check_velocity_bounds')
-def check_velocity_bounds(row, ctx):
-    vr = safe_float(row.get('doppler_ms'))
-    ok = (vr is not None and abs(vr) <= VR_ABS_MAX)
-    return ok, None if ok else "vr_out"
+def check_velocity_bounds(cols, ctx):
+    return np.abs(cols['doppler_ms']) <= VR_ABS_MAX
 
 @register('check_gate_outlier_mad')
-def check_gate_outlier_mad(row, ctx):
-    bad = ctx['mad_fail_by_rowkey'].get((row['range_gate_index'], row['ray_idx']), False)
-    return (not bad), None
+def check_gate_outlier_mad(cols, ctx):
+    return ~ctx['mad_fail']
 
 @register('check_azimuth_coverage_gate')
-def check_azimuth_coverage_gate(row, ctx):
-    info = ctx['coverage_by_gate'].get(row['range_gate_index'], {'count':0,'span':0.0})
-    ok = (info['count'] >= MIN_RAYS and info['span'] >= MIN_SPAN_DEG)
-    return ok, None
+def check_azimuth_coverage_gate(cols, ctx):
+    return (ctx['az_count'] >= MIN_RAYS) & (ctx['az_span'] >= MIN_SPAN_DEG)
 
 @register('check_vertical_consistency')
-def check_vertical_consistency(row, ctx):
-    val = ctx['vert_metric_by_gate'].get(row['range_gate_index'])
-    ok = (val is None or val <= VERT_THR)
-    return ok, None
+def check_vertical_consistency(cols, ctx):
+    val = ctx['vert_metric']  # NaN = no neighbouring gate medians
+    return np.isnan(val) | (val <= VERT_THR)
 
 @register('check_gate_uniform_bin_fill')
-def check_gate_uniform_bin_fill(row, ctx):
-    info = ctx['binfill_by_gate'].get(row['range_gate_index'], {'nonempty':0})
-    return (info['nonempty'] >= MIN_NONEMPTY_BINS), None
+def check_gate_uniform_bin_fill(cols, ctx):
+    return ctx['bin_nonempty'] >= MIN_NONEMPTY_BINS
 
 # ----------------------
 # Logic & DB Helpers
@@ -190,83 +180,154 @@ def fetch_pending_headers(conn, limit=1000):
         cur.execute(sql, (limit,))
         return [r['header_id'] for r in cur.fetchall()]
 
-def precompute_gate_context(rows, header):
-    by_gate = defaultdict(list)
-    for r in rows: by_gate[r['range_gate_index']].append(r)
-
-    canon_az_by_rowkey, dup_by_rowkey, unique_canon_by_gate = {}, {}, {}
-    for gi, lst in by_gate.items():
-        c, d, u = snap_azimuths_per_gate(lst)
-        canon_az_by_rowkey.update(c); dup_by_rowkey.update(d); unique_canon_by_gate[gi] = u
-
-    mad_fail_by_rowkey, gate_medians = {}, {}
-    for gi, lst in by_gate.items():
-        vrs = [safe_float(x.get('doppler_ms')) for x in lst if x.get('doppler_ms') is not None]
-        med = median(vrs) if vrs else None
-        gate_medians[gi] = med
-        m = max(mad(vrs, med) if vrs else 0.05, 0.05)
-        if med is not None:
-            for x in lst:
-                vr = safe_float(x.get('doppler_ms'))
-                mad_fail_by_rowkey[(gi, x['ray_idx'])] = (vr is None or (abs(vr - med) / (1.4826 * m)) > MAD_K)
-
-    coverage_by_gate, binfill_by_gate = {}, {}
-    for gi in by_gate.keys():
-        uniq = unique_canon_by_gate.get(gi, [])
-        coverage_by_gate[gi] = {'count': len(uniq), 'span': circular_span_deg(uniq)}
-        binfill_by_gate[gi] = {'nonempty': len(set(int(a // BIN_DEG) for a in uniq))}
-
-    vert_metric_by_gate = {}
-    gis = sorted(by_gate.keys())
-    for idx, gi in enumerate(gis):
-        nbrs = [gate_medians.get(gis[idx+s]) for s in [-1, 1] if 0 <= idx+s < len(gis)]
-        nbrs = [v for v in nbrs if v is not None]
-        cur = gate_medians.get(gi)
-        vert_metric_by_gate[gi] = abs(cur - (sum(nbrs)/len(nbrs))) if (cur is not None and nbrs) else None
-
+# Gate row fields the rules read as numbers, and the integer keys of each row
+QC_FIELDS = ('doppler_ms', 'azimuth_deg', 'elevation_deg', 'intensity_snr_plus1',
+             'spectral_width_ms', 'pitch_deg', 'roll_deg')
+KEY_FIELDS = ('range_gate_index', 'ray_idx')
+
+def gate_columns(rows):
+    """Columnar view of a header's gate rows: int32 KEY_FIELDS, float QC_FIELDS (NULL -> NaN)"""
+    cols = {k: np.fromiter((r[k] for r in rows), dtype=np.int32, count=len(rows)) for k in KEY_FIELDS}
+    # DOUBLE columns arrive as float or None; a float-dtype array turns None into NaN in one C pass
+    cols.update({k: np.array([r.get(k) for r in rows], dtype=float) for k in QC_FIELDS})
+    return cols
+
+def fetch_header_batch(conn, hids):
+    """Header rows by id and gate columns (see gate_columns) by header_id for a batch of headers (2 queries)"""
+    rows_by_hid = defaultdict(list)
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM wind_profile_header WHERE header_id IN %s", (tuple(hids),))
+        headers = {h['header_id']: h for h in cur.fetchall()}
+    # Gate rows are streamed (unbuffered) straight into their header groups
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+        cur.execute("SELECT * FROM wind_profile_gate WHERE header_id IN %s", (tuple(hids),))
+        for r in cur: rows_by_hid[r['header_id']].append(r)
+    # The row dicts are dropped here; everything downstream works on the arrays
+    return headers, {hid: gate_columns(rows) for hid, rows in rows_by_hid.items()}
+
+def precompute_gate_context(cols, header):
+    n = len(cols['range_gate_index'])
+    gate, az, vr = cols['range_gate_index'], norm360(cols['azimuth_deg']), cols['doppler_ms']
+
+    # Sort once by (gate, azimuth): each gate becomes one contiguous [start:end) slice
+    order = np.lexsort((az, gate))
+    gate_s, az_s, vr_s = gate[order], az[order], vr[order]
+    starts = np.flatnonzero(np.diff(gate_s, prepend=gate_s[:1] - 1))
+    ends = np.append(starts[1:], n).astype(int)
+
+    n_gates = len(starts)
+    dup_s, mad_fail_s = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+    az_count, bin_nonempty = np.zeros(n_gates, dtype=int), np.zeros(n_gates, dtype=int)
+    az_span, meds = np.zeros(n_gates), np.full(n_gates, np.nan)
+    for g, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        dup_s[s:e], uniq = snap_azimuths_per_gate(az_s[s:e])
+        az_count[g], az_span[g] = len(uniq), circular_span_deg(uniq)
+        # Occupied BIN_DEG sectors as bits of one int (36 for 10 deg), counted with bit_count()
+        bins = 0
+        for a in uniq: bins |= 1 << int(a // BIN_DEG)
+        bin_nonempty[g] = bins.bit_count()
+
+        v = vr_s[s:e]
+        has_vr = ~np.isnan(v)
+        if not has_vr.any(): continue
+        meds[g] = med = float(np.median(v[has_vr]))
+        m = max(float(np.median(np.abs(v[has_vr] - med))), 0.05)
+        mad_fail_s[s:e] = ~has_vr | (np.abs(v - med) / (1.4826 * m) > MAD_K)
+
+    # |median - mean of the neighbouring gates' medians| (NaN when the gate or both neighbours lack one)
+    nbrs = np.full((2, n_gates), np.nan)
+    nbrs[0, 1:], nbrs[1, :-1] = meds[:-1], meds[1:]
+    n_nbrs = (~np.isnan(nbrs)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vert = np.where(n_nbrs > 0, np.abs(meds - np.nansum(nbrs, axis=0) / n_nbrs), np.nan)
+
+    # Back to row order: per-row results are un-sorted, per-gate ones gathered by gate slot
+    dup, mad_fail, slot = np.empty(n, dtype=bool), np.empty(n, dtype=bool), np.empty(n, dtype=int)
+    dup[order], mad_fail[order] = dup_s, mad_fail_s
+    slot[order] = np.repeat(np.arange(n_gates), ends - starts)
     return {
-        'mad_fail_by_rowkey': mad_fail_by_rowkey, 'coverage_by_gate': coverage_by_gate,
-        'binfill_by_gate': binfill_by_gate, 'az_dup_by_rowkey': dup_by_rowkey,
-        'vert_metric_by_gate': vert_metric_by_gate, 'instrument_spectral_width_ms': header.get('instrument_spectral_width_ms')
+        'az_dup': dup,
+        'mad_fail': mad_fail,
+        'az_count': az_count[slot],
+        'az_span': az_span[slot],
+        'bin_nonempty': bin_nonempty[slot],
+        'vert_metric': vert[slot],
+        'instrument_spectral_width_ms': header.get('instrument_spectral_width_ms')
     }
 
+@lru_cache(maxsize=8)
+def fuse_rules(rule_names):
+    """One function for the active rule set (tuple of def_names): (cols, ctx) -> rows x rules failure matrix"""
+    funcs = tuple(RULE_REGISTRY[name] for name in rule_names)
+    def failures(cols, ctx):
+        fail_mat = np.empty((len(cols[QC_FIELDS[0]]), len(funcs)), dtype=bool)
+        for j, func in enumerate(funcs):
+            np.logical_not(func(cols, ctx), out=fail_mat[:, j])
+        return fail_mat
+    return failures
+
 def run_qc_process(conn):
-    """Primary execution logic for QC tagging"""
+    """Primary execution logic for QC tagging; returns the number of gate rows tagged"""
     with conn.cursor() as cur:
         cur.execute("SELECT rule_id, def_name FROM vad_rule_qc WHERE is_active=1")
-        rules = [(int(r['rule_id']), r['def_name'], RULE_REGISTRY[r['def_name']]) for r in cur.fetchall() if r['def_name'] in RULE_REGISTRY]
+        rules = [(str(r['rule_id']), r['def_name']) for r in cur.fetchall() if r['def_name'] in RULE_REGISTRY]
+    rule_ids, rule_names = [r_id for r_id, _ in rules], tuple(name for _, name in rules)
     
     pending = fetch_pending_headers(conn, 2000)
     if not pending:
         logger.info("No pending header IDs found.")
-        return
+        return 0
 
     print(f"Found {len(pending)} pending header IDs. Starting...")
-    for idx, hid in enumerate(pending, 1):
+    tagged = 0
+    # Headers are evaluated in worker processes; this process only fetches and writes, in header order.
+    # 'spawn' workers: main() may run on a Dashboard worker thread, and forking a multi-threaded
+    # process can deadlock on locks held by other threads.
+    with ProcessPoolExecutor(max_workers=QC_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for start in range(0, len(pending), FETCH_HEADERS):
+            batch = pending[start:start + FETCH_HEADERS]
+            try:
+                headers, cols_by_hid = fetch_header_batch(conn, batch)
+            except Exception as e:
+                conn.rollback(); logger.error(f"Error fetching Headers {batch[0]}..{batch[-1]}: {e}"); continue
+            futures = {hid: pool.submit(qc_header, hid, headers[hid], cols_by_hid.get(hid) or gate_columns([]),
+                                        rule_names, rule_ids) for hid in batch if hid in headers}
+            tagged += tag_headers(conn, batch, futures, start, len(pending))
+    return tagged
+
+def qc_header(hid, header, cols, rule_names, rule_ids):
+    """Runs the rules over one header's gate columns (in a worker process); returns its tag rows and fail count"""
+    ctx, n_rows = precompute_gate_context(cols, header), len(cols['ray_idx'])
+    # rows x rules failure matrix; CSVs are only built for the rows that failed something
+    fail_mat = fuse_rules(rule_names)(cols, ctx)
+    fail_counts = fail_mat.sum(axis=1).tolist()
+    fail_csv = [None] * n_rows
+    for i in np.flatnonzero(fail_mat.any(axis=1)).tolist():
+        fail_csv[i] = ",".join(rule_ids[j] for j in np.flatnonzero(fail_mat[i]).tolist())
+    updates = [(hid, rgi, ray, 0 if n else 1, csv, n) for rgi, ray, n, csv in
+               zip(cols['range_gate_index'].tolist(), cols['ray_idx'].tolist(), fail_counts, fail_csv)]
+    return updates, sum(1 for n in fail_counts if n)
+
+def tag_headers(conn, batch, futures, start, total):
+    """Collects each header's evaluated tags and writes them (one commit per header)"""
+    tagged, last_update = 0, 0.0
+    for idx, hid in enumerate(batch, start + 1):
         try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM wind_profile_header WHERE header_id=%s", (hid,))
-                header = cur.fetchone()
-                cur.execute("SELECT * FROM wind_profile_gate WHERE header_id=%s", (hid,))
-                rows = cur.fetchall()
-            
-            ctx = precompute_gate_context(rows, header)
-            updates, pass_cnt, fail_cnt = [], 0, 0
-            for i, row in enumerate(rows, 1):
-                f_ids = [r_id for r_id, name, func in rules if not func(row, ctx)[0]]
-                if f_ids: fail_cnt += 1
-                else: pass_cnt += 1
-                updates.append((1 if not f_ids else 0, ",".join(map(str, f_ids)) if f_ids else None, len(f_ids), hid, row['range_gate_index'], row['ray_idx']))
-                
-                if i % 100 == 0 or i == len(rows):
-                    sys.stdout.write(f"\r[Batch {idx}/{len(pending)}] Header {hid} | Pass: {pass_cnt} Fail: {fail_cnt}".ljust(100))
-                    sys.stdout.flush()
+            updates, fail_cnt = futures[hid].result()
+            n_rows = len(updates)
+            now = time.monotonic()
+            if now - last_update >= PROGRESS_INTERVAL_S or idx == total:
+                sys.stdout.write(f"\r[Batch {idx}/{total}] Header {hid} | Pass: {n_rows - fail_cnt} Fail: {fail_cnt}".ljust(100))
+                sys.stdout.flush()
+                last_update = now
 
             with conn.cursor() as cur:
-                cur.executemany("UPDATE wind_profile_gate SET qc_selected=%s, qc_failed_rules_csv=%s, qc_failed_rule_count=%s WHERE header_id=%s AND range_gate_index=%s AND ray_idx=%s", updates)
+                cur.executemany(QC_TAG_UPSERT_SQL, updates)
             conn.commit()
+            tagged += len(updates)
         except Exception as e:
             conn.rollback(); logger.error(f"Error on Header {hid}: {e}")
+    return tagged
 
 # =========================
 # Entry Points
@@ -276,9 +337,10 @@ def main():
     """Consolidated main entry point for script and dashboard"""
     try:
         conn = get_connection()
-        run_qc_process(conn)
+        tagged = run_qc_process(conn)
         conn.close()
         print("\n[DONE] QC Tagging Finished.")
+        return tagged
     except Exception as e:
         logger.error(f"QC process failed: {e}")
         raise e 
@@ -0,0 +1,15 @@
+-- ----------------------------
+-- File: schema_indexes.sql
+-- Secondary indexes behind the Dashboard queries (header log ORDER BY start_time
+-- LIMIT 50, per-header run counts, MIN/MAX start_time scope, status = 'ok' date list,
+-- rules ORDER BY rule_order).
+-- idx_header_date is a functional index (MySQL 8.0.13+) on the DATE(start_time) the date list groups by.
+-- Applied idempotently by: python dooplerReset.py --indexes
+-- (MySQL 8 has no CREATE INDEX IF NOT EXISTS, so the reset tool skips indexes already present)
+-- ----------------------------
+
+CREATE INDEX `idx_header_time` ON `wind_profile_header` (`start_time`);
+CREATE INDEX `idx_header_date` ON `wind_profile_header` ((DATE(`start_time`)));
+CREATE INDEX `idx_vgf_header_run` ON `vad_gate_fit` (`header_id`, `run_id`);
+CREATE INDEX `idx_vgf_status_run` ON `vad_gate_fit` (`status`, `header_id`, `run_id`);
+CREATE INDEX `idx_rule_order` ON `vad_rule_qc` (`rule_order`);
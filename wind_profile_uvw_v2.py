@@ -14,6 +14,7 @@ import math
 import time
 import logging
 import numpy as np
+from collections import defaultdict
 import pymysql
 from typing import Dict, List, Any
 
@@ -52,7 +53,7 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(
 
 class DB:
     def __init__(self, cfg): self.conn = pymysql.connect(**cfg)
-    def cursor(self): return self.conn.cursor()
+    def cursor(self, cursor=None): return self.conn.cursor(cursor)
     def commit(self): self.conn.commit()
     def rollback(self): self.conn.rollback()
     def close(self): self.conn.close()
@@ -87,6 +88,49 @@ def solve_vad_unweighted(az_deg, vr_ms, elev_rad):
         "r2": r2, "rmse": rmse, "svd": svals.tolist(), "rank": int(rank), "cond": cond
     }
 
+def solve_vad_batch(az_deg, vr_ms, elev_rad):
+    """
+    solve_vad_unweighted for G gates with the same ray count at once:
+    az_deg/vr_ms are (G, n), elev_rad is (G,). One batched SVD gives the same
+    minimum-norm least-squares solution, rank and singular values as lstsq.
+    Gates sharing a scan geometry share one SVD; only their velocities differ.
+    """
+    # Ray order does not change the fit, so rays are put in azimuth order and
+    # gates with the same azimuths and elevation reduce to one design matrix
+    order = np.argsort(az_deg, axis=1, kind='stable')
+    az_deg, y = np.take_along_axis(az_deg, order, axis=1), np.take_along_axis(vr_ms, order, axis=1)
+    geom, inv = np.unique(np.column_stack([az_deg, elev_rad]), axis=0, return_inverse=True)
+    inv = inv.reshape(-1)
+    n = y.shape[1]
+
+    theta = np.deg2rad(geom[:, :n])
+    cphi, sphi = np.cos(geom[:, n])[:, None], np.sin(geom[:, n])[:, None]
+    A_geom = np.stack([np.cos(theta)*cphi, np.sin(theta)*cphi, np.broadcast_to(sphi, theta.shape)], axis=-1)
+    U, svals, Vt = (m[inv] for m in np.linalg.svd(A_geom, full_matrices=False))
+    A = A_geom[inv]
+    # lstsq(rcond=None) drops singular values <= eps * max(M, N) * s_max
+    keep = svals > np.finfo(float).eps * max(n, 3) * svals[:, :1]
+    s_inv = np.where(keep, 1.0 / np.where(keep, svals, 1.0), 0.0)
+    x = np.einsum('gij,gi->gj', Vt, s_inv * np.einsum('gni,gn->gi', U, y))
+    u, v, w = x[:, 0], x[:, 1], x[:, 2]
+
+    # Diagnostics
+    yhat = np.einsum('gnj,gj->gn', A, x)
+    ss_res = np.sum((y - yhat) ** 2, axis=1)
+    ss_tot = np.sum((y - y.mean(axis=1, keepdims=True)) ** 2, axis=1)
+    r2 = np.where(ss_tot > 0, 1.0 - ss_res / np.where(ss_tot > 0, ss_tot, 1.0), 0.0)
+    rmse = np.sqrt(ss_res / max(n - 3, 1))
+    speed = np.hypot(u, v)
+    dir_deg = (np.degrees(np.arctan2(u, v)) % 360.0 + 180.0) % 360.0
+    with np.errstate(divide='ignore'):
+        cond = np.where(svals[:, -1] > 0, svals[:, 0] / svals[:, -1], np.inf)
+    if svals.shape[1] < 2: cond[:] = np.inf
+
+    cols = zip(u.tolist(), v.tolist(), w.tolist(), speed.tolist(), dir_deg.tolist(), r2.tolist(),
+               rmse.tolist(), svals.tolist(), keep.sum(axis=1).tolist(), cond.tolist())
+    return [{"u": a, "v": b, "w": c, "speed": s, "dir_deg": d, "r2": q, "rmse": e, "svd": sv, "rank": k, "cond": cn}
+            for a, b, c, s, d, q, e, sv, k, cn in cols]
+
 def circular_span_deg(angles_deg):
     if angles_deg.size == 0: return 0.0
     a = np.sort(angles_deg % 360.0)
@@ -108,27 +152,72 @@ def fetch_solvable_gates(db):
         cur.execute(sql, (CONFIG['min_selected_to_solve'],))
         return cur.fetchall()
 
+def fetch_batch_rays(db, target_gates):
+    """
+    One query for a whole batch: per (header_id, range_gate_index) the top
+    max_selected QC-passed rays by SNR, each carrying the gate's total ray count.
+    """
+    c = CONFIG["cols"]
+    sql = f"""
+        SELECT header_id, range_gate_index, ray_idx, az, el, vr, n_total FROM (
+            SELECT header_id, range_gate_index, ray_idx, {c['qc']} as qc,
+                   {c['azi']} as az, {c['elev']} as el, {c['vr_ms']} as vr,
+                   ROW_NUMBER() OVER (PARTITION BY header_id, range_gate_index, {c['qc']}
+                                      ORDER BY {c['snr']} DESC, ray_idx) as rn,
+                   COUNT(*) OVER (PARTITION BY header_id, range_gate_index) as n_total
+            FROM {CONFIG['table_gate']}
+            WHERE (header_id, range_gate_index) IN %s
+        ) t
+        WHERE qc = 1 AND rn <= %s
+        ORDER BY header_id, range_gate_index, rn
+    """
+    keys = tuple((g["header_id"], g["range_gate_index"]) for g in target_gates)
+    rays_by_gate = {}
+    with db.cursor(pymysql.cursors.SSDictCursor) as cur:
+        cur.execute(sql, (keys, CONFIG['max_selected']))
+        for r in cur:
+            rays_by_gate.setdefault((r['header_id'], r['range_gate_index']), []).append(r)
+    return rays_by_gate
+
+def solve_gates(gates):
+    """
+    Solves the prepared gates, batching those with the same ray count into one
+    solve_vad_batch call. Returns one solution per gate, or None where it failed.
+    """
+    sols = [None] * len(gates)
+    by_count = defaultdict(list)
+    for i, g in enumerate(gates): by_count[len(g["az"])].append(i)
+
+    for idx in by_count.values():
+        az = np.array([gates[i]["az"] for i in idx], dtype=float)
+        vr = np.array([gates[i]["vr"] for i in idx], dtype=float)
+        elev = np.array([gates[i]["elev"] for i in idx], dtype=float)
+        # A NULL azimuth/velocity becomes NaN here; those gates stay None (solve_fail)
+        ok = np.isfinite(az).all(axis=1) & np.isfinite(vr).all(axis=1)
+        idx = [i for i, good in zip(idx, ok.tolist()) if good]
+        try:
+            batch = solve_vad_batch(az[ok], vr[ok], elev[ok])
+        except Exception:
+            batch = None
+        for k, i in enumerate(idx):
+            if batch is not None:
+                sols[i] = batch[k]; continue
+            # Batch solve failed: solve one by one so only the bad gates fail
+            try: sols[i] = solve_vad_unweighted(gates[i]["az"], gates[i]["vr"], gates[i]["elev"])
+            except Exception: pass
+    return sols
+
 def process_gate_batch(db, target_gates, run_id, rule_tag):
     results = []
-    c = CONFIG["cols"]
+    prepared = []
     
+    # 1. Fetch Rays for the whole batch (Prioritize High SNR)
+    rays_by_gate = fetch_batch_rays(db, target_gates)
     for g in target_gates:
         hid, rgi = g["header_id"], g["range_gate_index"]
-        
-        # 1. Fetch Rays (Prioritize High SNR)
-        sql_rays = f"""
-            SELECT ray_idx, {c['azi']} as az, {c['elev']} as el, {c['vr_ms']} as vr 
-            FROM {CONFIG['table_gate']} 
-            WHERE header_id=%s AND range_gate_index=%s AND {c['qc']}=1 
-            ORDER BY {c['snr']} DESC LIMIT %s
-        """
-        sql_tot = f"SELECT COUNT(*) as cnt FROM {CONFIG['table_gate']} WHERE header_id=%s AND range_gate_index=%s"
-        
-        with db.cursor() as cur:
-            cur.execute(sql_tot, (hid, rgi)); n_total = cur.fetchone()['cnt']
-            cur.execute(sql_rays, (hid, rgi, CONFIG['max_selected'])); rays = cur.fetchall()
-        
+        rays = rays_by_gate.get((hid, rgi))
         if not rays: continue
+        n_total = rays[0]['n_total']
         
         # 2. Prepare Data
         elevs = [r['el'] for r in rays if r['el'] is not None]
@@ -140,9 +229,14 @@ def process_gate_batch(db, target_gates, run_id, rule_tag):
         csv_ray = ",".join([str(r['ray_idx']) for r in rays])
         csv_az  = ",".join([f"{r['az']:.2f}" for r in rays])
         csv_el  = ",".join([f"{r['el']:.2f}" for r in rays]) if elevs else None
+        prepared.append({"hid": hid, "rgi": rgi, "n_total": n_total, "n_sel": len(rays), "az": az_vals, "vr": vr_vals,
+                         "elev": avg_elev, "csv_ray": csv_ray, "csv_az": csv_az, "csv_el": csv_el})
 
+    # 2b. Solve every gate of the batch (grouped by ray count)
+    for p, sol in zip(prepared, solve_gates(prepared)):
+        hid, rgi, az_vals = p["hid"], p["rgi"], p["az"]
         try:
-            sol = solve_vad_unweighted(az_vals, vr_vals, avg_elev)
+            if sol is None: raise ValueError("solve failed")
             
             # Diagnostics
             warns = []
@@ -154,12 +248,12 @@ def process_gate_batch(db, target_gates, run_id, rule_tag):
             # 3. Construct Result (Mapping Math Keys to DB Columns)
             res = {
                 "run_id": run_id, "rule_tag": rule_tag, "header_id": hid, "range_gate_index": rgi,
-                "n_total_rays": n_total, "n_selected_rays": len(rays),
+                "n_total_rays": p["n_total"], "n_selected_rays": p["n_sel"],
                 
                 # CSV Fields (Verified Present)
-                "selected_ray_idx_csv": csv_ray,
-                "selected_azimuth_deg_csv": csv_az,
-                "selected_elevation_deg_csv": csv_el,
+                "selected_ray_idx_csv": p["csv_ray"],
+                "selected_azimuth_deg_csv": p["csv_az"],
+                "selected_elevation_deg_csv": p["csv_el"],
                 
                 "az_span_deg": round(span, 3), 
                 "warn_flags": ",".join(warns) if warns else None,
@@ -171,7 +265,8 @@ def process_gate_batch(db, target_gates, run_id, rule_tag):
                 "u_ms": sol["u"], "v_ms": sol["v"], "w_ms": sol["w"],
                 "speed_ms": sol["speed"], "dir_deg": sol["dir_deg"],
                 "r2": sol["r2"], "rmse_ms": sol["rmse"],
-                "cond_num": sol["cond"], "a_rank": sol["rank"]
+                # inf (rank-deficient A) cannot be sent to MySQL; store it as NULL
+                "cond_num": sol["cond"] if math.isfinite(sol["cond"]) else None, "a_rank": sol["rank"]
             }
             results.append(res)
         except Exception:
@@ -221,16 +316,18 @@ def main():
         gates = fetch_solvable_gates(db)
         if not gates:
             logging.warning("No solvable gates found.")
-            return
+            return 0
 
         logging.info(f"Found {len(gates)} solvable gates.")
         batch_size = CONFIG["batch_size"]
+        solved = 0
         
         # 3. Process
         for i in range(0, len(gates), batch_size):
             batch = gates[i : i + batch_size]
             results = process_gate_batch(db, batch, run_id, rule_tag)
             bulk_upsert(db, results)
+            solved += len(results)
             logging.info(f"Processed batch {i // batch_size + 1} ({len(results)} rows)")
 
         # 4. Finish
@@ -238,6 +335,7 @@ def main():
             cur.execute(f"UPDATE {CONFIG['table_run']} SET finished_at=NOW() WHERE run_id=%s", (run_id,))
         db.commit()
         logging.info("Run Completed Successfully.")
+        return solved
 
     except Exception as e:
         db.rollback(); logging.exception("Error")